@@ -1,21 +1,104 @@
-from flask import Flask, render_template, request, jsonify
-import json
-import pandas as pd
-import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-import plotly.graph_objs as go
-import plotly.offline as pyo
-import plotly.express as px
-from datetime import datetime
+import math
+import os
+import time
+
+from flask import Flask, Response, g, render_template, request, jsonify
+from werkzeug.wsgi import wrap_file
+
+# 分析用の重いライブラリ（pandas・scikit-learn など）は処理の中で必要になった時点で
+# 読み込む。起動時間は startup_profile.py で確認できる
+from data.dataset import Dataset
+from data.metrics import (
+    DATASET_VERSION,
+    REGISTRY,
+    REQUEST_COUNT,
+    REQUEST_LATENCY,
+    ROSTER_SIZE,
+    ROSTER_STORE_BYTES,
+    stage_timer,
+)
+from data.prepared_response import FilePreparedResponse, PreparedResponse
+from data.projection import DEFAULT_MAP_POINTS, MAX_MAP_POINTS
+from data.recommender import DEFAULT_NPROBE
+from data.reload_job import ReloadJobManager
+from data.result_cache import RecommendationCache, preference_cache_key
+from data.shared_dataset import SHARED_DIR_ENV, SharedDatasetStore
 
 app = Flask(__name__)
 
-# グローバル変数でデータを保持
-vtuber_data = None
-clusters = None
-scaler = None
+# 現在のデータセット（差し替えは参照の代入1回で行う）
+dataset = None
+
+# MCPデータ再読み込みのバックグラウンドジョブ
+reload_jobs = ReloadJobManager()
+
+# 推薦結果のキャッシュ（データセットが差し替わると破棄される）
+recommendation_cache = RecommendationCache(maxsize=1024, ttl=300)
+
+# データセットがない場合の /api/vtubers の本文
+EMPTY_VTUBERS_RESPONSE = PreparedResponse([])
+
+# 共有モード（環境変数 VTUBER_SHARED_DIR を設定した場合）では、データセットを
+# 共有ディレクトリに書き出して全プロセスでメモリマップして使う
+shared_datasets = (
+    SharedDatasetStore(os.environ[SHARED_DIR_ENV])
+    if os.environ.get(SHARED_DIR_ENV)
+    else None
+)
+
+
+def publish_dataset(new_dataset):
+    """データセットを差し替える
+
+    共有モードでは新しい世代として書き出し、それをメモリマップしたデータセットに
+    差し替える（他のプロセスも次のリクエストで同じ世代に切り替わる）。
+    """
+    if shared_datasets is not None:
+        new_dataset = shared_datasets.publish(new_dataset)
+    set_dataset(new_dataset)
+
+
+def set_dataset(new_dataset):
+    """このプロセスが参照するデータセットを差し替える"""
+    global dataset
+    dataset = new_dataset
+    ROSTER_SIZE.set(len(new_dataset.recommender.roster))
+    DATASET_VERSION.set(new_dataset.version)
+    ROSTER_STORE_BYTES.set(new_dataset.recommender.roster.nbytes)
+
+
+@app.before_request
+def sync_shared_dataset():
+    """共有モードでは、他のプロセスが新しい世代を公開していればそれに切り替える"""
+    if shared_datasets is None:
+        return
+    new_dataset = shared_datasets.refresh(dataset)
+    if new_dataset is not None:
+        set_dataset(new_dataset)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """ルートごとのリクエスト数と処理時間を記録（ルートはURLの雛形で集計）"""
+    started = g.pop("request_started", None)
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    if started is not None:
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - started, method=request.method, route=route
+        )
+    REQUEST_COUNT.inc(method=request.method, route=route, status=response.status_code)
+    return response
+
+
+@app.route("/metrics")
+def metrics():
+    """計測値を Prometheus のテキスト形式で返す"""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/")
@@ -25,18 +108,41 @@ def index():
 
 @app.route("/api/vtubers")
 def get_vtubers():
-    global vtuber_data
-    if vtuber_data is not None:
-        return jsonify(vtuber_data.to_dict("records"))
-    return jsonify([])
+    current = dataset
+    prepared = (
+        current.vtubers_response if current is not None else EMPTY_VTUBERS_RESPONSE
+    )
+    encoding = prepared.negotiate(request.accept_encodings)
+
+    if prepared.matches(request.if_none_match):
+        response = Response(status=304)
+    else:
+        if isinstance(prepared, FilePreparedResponse):
+            # 共有データセットの本文はファイルから送る（sendfile が使えればコピーしない）
+            response = Response(
+                wrap_file(request.environ, prepared.open(encoding)),
+                mimetype=prepared.mimetype,
+                direct_passthrough=True,
+            )
+            response.content_length = prepared.sizes[encoding]
+        else:
+            response = Response(prepared.encoded[encoding], mimetype=prepared.mimetype)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
 
+    response.set_etag(prepared.etags[encoding])
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
-@app.route("/api/recommend", methods=["POST"])
-def recommend():
-    data = request.json
 
-    # ユーザーの選択に基づいて推薦を実行
-    preferences = {
+# 一括推薦で1回に受け付ける嗜好の最大数
+MAX_BATCH_PREFERENCES = 1000
+
+
+def parse_preferences(data):
+    """リクエストの選択内容を嗜好の辞書に変換"""
+    return {
         "streaming_genre": data.get("streaming_genre", []),
         "game_genre": data.get("game_genre", []),
         "streaming_time": data.get("streaming_time", ""),
@@ -45,120 +151,436 @@ def recommend():
         "personality": data.get("personality", []),
     }
 
-    recommended_vtubers = calculate_recommendations(preferences)
-    return jsonify(recommended_vtubers)
 
+@app.route("/api/recommend", methods=["POST"])
+def recommend():
+    """選択内容に基づく推薦結果を返す
 
-def calculate_recommendations(preferences):
-    global vtuber_data, clusters
+    本文に "nprobe" を指定すると、推薦スコアが高そうなクラスタから nprobe 個だけを
+    採点する（速いが近似。省略時は環境変数 VTUBER_RECOMMEND_NPROBE、それもなければ全件）。
+    """
+    data = request.json
 
-    if vtuber_data is None:
-        return []
+    nprobe = data.get("nprobe", DEFAULT_NPROBE)
+    if nprobe is not None and (
+        not isinstance(nprobe, int) or isinstance(nprobe, bool) or nprobe < 1
+    ):
+        return jsonify(
+            {"success": False, "message": "nprobe には1以上の整数を指定してください"}
+        ), 400
 
-    # 推薦スコアを計算
-    scores = []
-    for idx, vtuber in vtuber_data.iterrows():
-        score = 0
-
-        # 配信ジャンルのマッチング
-        if preferences["streaming_genre"]:
-            genre_matches = sum(
-                1
-                for genre in preferences["streaming_genre"]
-                if genre in vtuber.get("streaming_genres", [])
-            )
-            score += genre_matches * 3
-
-        # ゲームジャンルのマッチング
-        if preferences["game_genre"]:
-            game_matches = sum(
-                1
-                for game in preferences["game_genre"]
-                if game in vtuber.get("game_genres", [])
-            )
-            score += game_matches * 2
+    # ユーザーの選択に基づいて推薦を実行
+    preferences = parse_preferences(data)
 
-        # 配信時間のマッチング
-        if preferences["streaming_time"] and preferences[
-            "streaming_time"
-        ] == vtuber.get("main_streaming_time"):
-            score += 5
+    recommended_vtubers = calculate_recommendations(preferences, nprobe=nprobe)
+    return jsonify(recommended_vtubers)
 
-        # 性別のマッチング
-        if preferences["gender"] and preferences["gender"] == vtuber.get("gender"):
-            score += 2
 
-        # 声質のマッチング
-        if preferences["voice_type"] and preferences["voice_type"] == vtuber.get(
-            "voice_type"
-        ):
-            score += 3
-
-        # 性格のマッチング
-        if preferences["personality"]:
-            personality_matches = sum(
-                1
-                for trait in preferences["personality"]
-                if trait in vtuber.get("personality_traits", [])
-            )
-            score += personality_matches * 2
+@app.route("/api/recommend/batch", methods=["POST"])
+def recommend_batch():
+    """複数の選択内容の推薦結果をまとめて返す
 
-        scores.append((score, vtuber.to_dict()))
+    本文は {"preferences": [選択内容, ...], "k": 10}（選択内容のリストだけでもよい）。
+    結果は選択内容と同じ順のリストで、それぞれ /api/recommend と同じ並び順。
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        items, k = data.get("preferences"), data.get("k", 10)
+    else:
+        items, k = data, 10
 
-    # スコア順でソート
-    scores.sort(key=lambda x: x[0], reverse=True)
-    return [vtuber for score, vtuber in scores[:10]]
+    if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+        return jsonify(
+            {"success": False, "message": "preferences には選択内容のリストを指定してください"}
+        ), 400
+    if len(items) > MAX_BATCH_PREFERENCES:
+        return jsonify(
+            {
+                "success": False,
+                "message": f"一度に指定できる選択内容は{MAX_BATCH_PREFERENCES}件までです",
+            }
+        ), 400
+    if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= 100:
+        return jsonify(
+            {"success": False, "message": "k には1〜100の整数を指定してください"}
+        ), 400
 
+    preferences_list = [parse_preferences(item) for item in items]
+    return jsonify(calculate_batch_recommendations(preferences_list, k))
 
-@app.route("/api/load_mcp_data", methods=["POST"])
-def load_mcp_data():
-    """MCPサーバーから最新のライバーデータを取得"""
-    global vtuber_data, clusters, scaler
 
-    try:
-        # MCPデータローダーを試行
-        from data.mcp_data_loader import load_mcp_vtuber_data
+def calculate_recommendations(preferences, nprobe=None):
+    current = dataset
 
-        mcp_vtubers = load_mcp_vtuber_data()
+    if current is None:
+        return []
 
-        if mcp_vtubers:
-            # MCPデータをDataFrameに変換
-            import pandas as pd
-            from data.vtuber_data import encode_categorical_features, perform_clustering
+    # 同じ嗜好の推薦結果はキャッシュから返す（絞り込み探索の結果は nprobe ごとに分ける）
+    key = preference_cache_key(preferences)
+    if key is not None and nprobe is not None:
+        key += (("nprobe", nprobe),)
+    if key is not None:
+        cached = recommendation_cache.get(current.version, key)
+        if cached is not None:
+            return list(cached)
+
+    # 推薦スコアを計算し、上位10件だけを返す（同点は元の並び順を維持）
+    result = current.recommender.recommend(preferences, k=10, nprobe=nprobe)
+
+    if key is not None:
+        recommendation_cache.put(current.version, key, result)
+    return list(result)
+
+
+def calculate_batch_recommendations(preferences_list, k=10):
+    """複数の嗜好の推薦結果を返す（キャッシュにないものだけをまとめて計算）"""
+    current = dataset
+
+    if current is None:
+        return [[] for _ in preferences_list]
+
+    results = [None] * len(preferences_list)
+    keys = [None] * len(preferences_list)
+    misses = []
+    for i, preferences in enumerate(preferences_list):
+        # キャッシュは /api/recommend と同じ上位10件の結果だけを共有する
+        if k == 10:
+            keys[i] = preference_cache_key(preferences)
+        if keys[i] is not None:
+            cached = recommendation_cache.get(current.version, keys[i])
+            if cached is not None:
+                results[i] = list(cached)
+                continue
+        misses.append(i)
+
+    computed = current.recommender.recommend_batch(
+        [preferences_list[i] for i in misses], k=k
+    )
+    for i, result in zip(misses, computed):
+        if keys[i] is not None:
+            recommendation_cache.put(current.version, keys[i], result)
+        results[i] = list(result)
+
+    return results
+
+
+@app.route("/api/similar/<name>")
+def similar_vtubers(name):
+    """指定したライバーに特徴が似ているライバーを返す
+
+    クエリパラメータ k で件数（既定10、最大100）、same_cluster=true で
+    同じクラスタのライバーだけに絞り込む。
+    """
+    current = dataset
+    if current is None or current.similarity is None or name not in current.similarity:
+        return jsonify(
+            {"success": False, "message": "指定されたライバーが見つかりません"}
+        ), 404
 
-            df = pd.DataFrame(mcp_vtubers)
-            df = encode_categorical_features(df)
-            df, new_clusters, new_scaler, kmeans = perform_clustering(df)
+    k = min(max(request.args.get("k", 10, type=int), 1), 100)
+    same_cluster = request.args.get("same_cluster", "").lower() in ("1", "true", "yes")
+    return jsonify(current.similarity.similar(name, k=k, same_cluster=same_cluster))
 
-            # グローバル変数を更新
-            vtuber_data = df
-            clusters = new_clusters
-            scaler = new_scaler
 
-            return jsonify(
-                {
-                    "success": True,
-                    "message": f"MCPサーバーから{len(mcp_vtubers)}名のライバーデータを取得しました",
-                    "vtuber_count": len(mcp_vtubers),
-                }
-            )
-        else:
+# 地図で間引かずに返す行（include）の最大数
+MAX_MAP_INCLUDE = 100
+
+
+@app.route("/api/map")
+def vtuber_map():
+    """ライバーの地図（特徴量のPCAの座標）を返す
+
+    クエリパラメータ dims で次元（2 または 3）、max_points で点の最大数
+    （既定2000、最大10000）。x_min・x_max・y_min・y_max を全て指定すると
+    その表示範囲の点だけを返す。点が max_points を超える場合は格子ごとに
+    1点に間引く。include に行番号をカンマ区切りで指定すると、その行
+    （推薦結果など）は間引きや表示範囲によらず返す。
+    配列は base64 で、rows は /api/vtubers の並びでの行番号。
+    """
+    current = dataset
+    if current is None or current.projection is None:
+        return jsonify({"success": False, "message": "地図のデータがありません"}), 404
+
+    dims = request.args.get("dims", 2, type=int)
+    if dims not in (2, 3):
+        return jsonify(
+            {"success": False, "message": "dims には2または3を指定してください"}
+        ), 400
+    max_points = min(
+        max(request.args.get("max_points", DEFAULT_MAP_POINTS, type=int), 1),
+        MAX_MAP_POINTS,
+    )
+
+    bounds = [request.args.get(key) for key in ("x_min", "x_max", "y_min", "y_max")]
+    viewport = None
+    if any(value is not None for value in bounds):
+        try:
+            viewport = tuple(float(value) for value in bounds)
+        except (TypeError, ValueError):
+            viewport = None
+        if (
+            viewport is None
+            or not all(math.isfinite(value) for value in viewport)
+            or viewport[0] > viewport[1]
+            or viewport[2] > viewport[3]
+        ):
             return jsonify(
                 {
                     "success": False,
-                    "message": "MCPサーバーからデータを取得できませんでした",
+                    "message": "表示範囲には x_min・x_max・y_min・y_max を全て数値で指定してください",
                 }
             ), 400
 
+    values = [value for value in request.args.get("include", "").split(",") if value]
+    if len(values) > MAX_MAP_INCLUDE:
+        return jsonify(
+            {
+                "success": False,
+                "message": f"include に指定できる行は{MAX_MAP_INCLUDE}件までです",
+            }
+        ), 400
+    try:
+        include = [int(value) for value in values]
+    except ValueError:
+        include = None
+    if include is None or not all(0 <= row < len(current.projection) for row in include):
+        return jsonify(
+            {"success": False, "message": "include には行番号をカンマ区切りで指定してください"}
+        ), 400
+
+    payload = current.projection.payload(dims, max_points, viewport, include=include)
+    return jsonify({"dataset_version": current.version, **payload})
+
+
+@app.route("/api/recommend/cache_stats")
+def recommend_cache_stats():
+    """推薦結果キャッシュのヒット・ミス・破棄の回数を返す"""
+    return jsonify(recommendation_cache.stats())
+
+
+class ReloadError(Exception):
+    """MCPサーバーからデータを取得できなかった"""
+
+
+def mcp_fetch_options(options):
+    """再読み込みの指定から詳細取得の同時実行数・レートの指定を取り出す
+
+    指定がなければ環境変数 VTUBER_MCP_MAX_CONCURRENCY・
+    VTUBER_MCP_REQUESTS_PER_SECOND（それもなければ既定値）が使われる。
+    """
+    fetch_options = {}
+    try:
+        if options.get("max_concurrency") is not None:
+            fetch_options["max_concurrency"] = int(options["max_concurrency"])
+        if options.get("requests_per_second") is not None:
+            fetch_options["requests_per_second"] = float(options["requests_per_second"])
+    except (TypeError, ValueError) as e:
+        raise ReloadError(f"取得オプションが不正です: {e}") from e
+    if fetch_options.get("max_concurrency", 1) < 1:
+        raise ReloadError("max_concurrency には1以上の整数を指定してください")
+    # 0 はレート制限なし（NaN は比較が偽になるため弾かれる）
+    if not fetch_options.get("requests_per_second", 0) >= 0:
+        raise ReloadError("requests_per_second には0以上の数値を指定してください")
+    return fetch_options
+
+
+def reload_dataset(options, progress):
+    """MCPサーバーからデータを取得して新しいデータセットに差し替える
+
+    バックグラウンドジョブとして実行される。{"mode": "incremental"} を指定すると、
+    新規のライバーと、既存のライバーのうち "recheck_fraction"（既定0.1）の割合を
+    毎回入れ替えながら取得し、追加・変更されたライバーだけを現在のロスターに反映する。
+    全件取得時は "clustering_backend"（"kmeans" / "minibatch"）・"batch_size"・
+    "max_iter" でクラスタリングの方法を、"n_clusters"（数値または "auto"）と
+    "time_budget"（自動選択にかける秒数）でクラスタ数を指定できる。
+    どちらの場合も "max_concurrency"・"requests_per_second" で詳細取得の
+    同時実行数とレートの上限を指定できる。
+    """
+    fetch_options = mcp_fetch_options(options)
+    current = dataset
+    # 共有データセットは df・学習結果を持たないため、世代のスナップショットから読み込む
+    current_df, _, current_scaler, current_kmeans = (
+        current.training_state() if current is not None else (None, None, None, None)
+    )
+
+    # 差分更新は内容ハッシュを持つ（MCPから取得した）ロスターでのみ可能
+    if (
+        options.get("mode") == "incremental"
+        and current_df is not None
+        and current_scaler is not None
+        and "content_hash" in current_df.columns
+    ):
+        from data.mcp_data_loader import fetch_mcp_vtuber_updates
+        from data.vtuber_data import apply_roster_updates
+
+        known_hashes = dict(zip(current_df["name"], current_df["content_hash"]))
+        if options.get("recheck_fraction") is not None:
+            try:
+                fetch_options["recheck_fraction"] = float(options["recheck_fraction"])
+            except (TypeError, ValueError) as e:
+                raise ReloadError(f"取得オプションが不正です: {e}") from e
+        diff = fetch_mcp_vtuber_updates(
+            known_hashes,
+            recheck_existing=bool(options.get("recheck_existing")),
+            progress=progress,
+            **fetch_options,
+        )
+        if diff is None:
+            raise ReloadError("MCPサーバーからデータを取得できませんでした")
+
+        updates, removed_names = diff
+        progress("差分を反映中", 0.85)
+        with stage_timer("apply_updates"):
+            df, new_clusters, new_scaler, kmeans, refitted = apply_roster_updates(
+                current_df,
+                updates,
+                removed_names,
+                current_scaler,
+                current_kmeans,
+                drift_threshold=float(options.get("drift_threshold", 0.2)),
+            )
+        message = (
+            f"MCPサーバーから差分を取得しました"
+            f"（追加・変更: {len(updates)}名, 削除: {len(removed_names)}名）"
+        )
+        extra = {
+            "updated_count": len(updates),
+            "removed_count": len(removed_names),
+            "refitted": refitted,
+        }
+    else:
+        # MCPデータローダーを試行（届いたチャンクから順に補完・エンコードする）
+        from data.mcp_data_loader import stream_mcp_vtuber_data
+        from data.vtuber_data import encode_vtuber_chunks, perform_clustering
+
+        df = encode_vtuber_chunks(
+            stream_mcp_vtuber_data(progress=progress, **fetch_options)
+        )
+        if len(df) == 0:
+            raise ReloadError("MCPサーバーからデータを取得できませんでした")
+
+        progress("クラスタリング中", 0.9)
+        # 同じライバーの前回のクラスタがあればウォームスタートに使う
+        previous_clusters = None
+        if current_df is not None and "cluster" in current_df.columns:
+            previous = dict(zip(current_df["name"], current_df["cluster"]))
+            previous_clusters = df["name"].map(previous).to_numpy()
+        try:
+            max_iter = int(options["max_iter"]) if options.get("max_iter") else None
+            clustering_options = {}
+            if options.get("time_budget") is not None:
+                clustering_options["time_budget"] = float(options["time_budget"])
+            with stage_timer("clustering"):
+                df, new_clusters, new_scaler, kmeans = perform_clustering(
+                    df,
+                    n_clusters=options.get("n_clusters"),
+                    backend=options.get("clustering_backend"),
+                    batch_size=int(options.get("batch_size", 1024)),
+                    max_iter=max_iter,
+                    previous_clusters=previous_clusters,
+                    **clustering_options,
+                )
+        except ValueError as e:
+            raise ReloadError(f"クラスタリングに失敗しました: {e}") from e
+        message = f"MCPサーバーから{len(df)}名のライバーデータを取得しました"
+        extra = {}
+        if hasattr(kmeans, "selection_report_"):
+            extra["cluster_selection"] = kmeans.selection_report_
+
+    # 変更がなければ現在のデータセットをそのまま使う
+    if current is not None and df is current_df:
+        return {
+            "message": message,
+            "vtuber_count": len(df),
+            "dataset_version": current.version,
+            **extra,
+        }
+
+    # 新しいデータセットを作成してから1回の代入で差し替える
+    progress("データセットを差し替え中", 0.95)
+    with stage_timer("build_dataset"):
+        new_dataset = Dataset.build(df, new_clusters, new_scaler, kmeans)
+    publish_dataset(new_dataset)
+
+    # 再起動時に再取得しなくて済むようスナップショットを保存
+    try:
+        from data.snapshot import save_snapshot
+
+        with stage_timer("snapshot_save"):
+            save_snapshot(df, new_clusters, new_scaler, kmeans)
     except Exception as e:
+        print(f"スナップショットの保存に失敗しました: {e}")
+
+    return {
+        "message": message,
+        "vtuber_count": len(df),
+        "dataset_version": new_dataset.version,
+        **extra,
+    }
+
+
+@app.route("/api/load_mcp_data", methods=["POST"])
+def load_mcp_data():
+    """MCPサーバーからのデータ再読み込みをバックグラウンドで開始
+
+    すぐにジョブIDを返す。実行中のジョブがある場合は新しいジョブを作らず、
+    実行中のジョブIDを返す。進捗は /api/load_mcp_data/<job_id> で確認できる。
+    """
+    options = request.get_json(silent=True) or {}
+
+    job, created = reload_jobs.submit(reload_dataset, options)
+    message = (
+        "MCPサーバーからのデータ取得を開始しました"
+        if created
+        else "実行中のデータ取得があるため、その完了を待ちます"
+    )
+    return jsonify(
+        {
+            "success": True,
+            "message": message,
+            "job_id": job.id,
+            "created": created,
+            "status": job.status,
+        }
+    ), 202
+
+
+@app.route("/api/load_mcp_data/<job_id>")
+def load_mcp_data_status(job_id):
+    """データ再読み込みジョブの状態と進捗を返す"""
+    job = reload_jobs.get(job_id)
+    if job is None:
         return jsonify(
-            {"success": False, "message": f"エラーが発生しました: {str(e)}"}
-        ), 500
+            {"success": False, "message": "指定されたジョブが見つかりません"}
+        ), 404
+    return jsonify({"success": True, **job.to_dict()})
 
 
-if __name__ == "__main__":
-    # データを初期化
-    from data.vtuber_data import load_vtuber_data, perform_clustering
+def initialize_dataset():
+    """データを初期化（保存済みのスナップショットがあれば再学習せずに使う）
+
+    共有モードで公開済みの世代があれば、構築せずにそれをメモリマップして使う。
+    """
+    from data.snapshot import SnapshotError, load_snapshot
+    from data.vtuber_data import load_vtuber_data
 
-    vtuber_data, clusters, scaler = load_vtuber_data()
+    if shared_datasets is not None and shared_datasets.generation() > 0:
+        shared = shared_datasets.refresh(None)
+        if shared is not None:
+            print(f"共有データセットの世代{shared.version}を使用します")
+            set_dataset(shared)
+            return
+
+    try:
+        df, clusters, scaler, kmeans, _ = load_snapshot()
+        print(f"スナップショットから{len(df)}名のライバーデータを読み込みました")
+    except SnapshotError as e:
+        print(f"スナップショットを使用せずにデータを構築します: {e}")
+        df, clusters, scaler = load_vtuber_data()
+        kmeans = None
+    publish_dataset(Dataset.build(df, clusters, scaler, kmeans))
+
+
+if __name__ == "__main__":
+    initialize_dataset()
     app.run(debug=True, host="0.0.0.0", port=8080)
@@ -0,0 +1,302 @@
+# 主要な処理のベンチマーク（合成データで計測し、結果をJSONで保存する）
+#
+#   python benchmark.py --sizes 1k 100k                 # 計測して benchmark-results/ に保存
+#   python benchmark.py --sizes 1k --compare base.json  # 前回の結果と比較（悪化したら終了コード1）
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT_DIR = os.path.join(PROJECT_ROOT, "benchmark-results")
+
+# 推薦の計測で使う嗜好の数
+RECOMMENDATION_QUERIES = 200
+
+
+def parse_size(text):
+    """"1k" / "100k" / "1M" のような件数の指定を解釈"""
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    number = text[:-1] if scale > 1 else text
+    return int(float(number) * scale)
+
+
+def summarize(latencies, rows=None):
+    """所要時間（秒）のリストから遅延のパーセンタイルとスループットを計算"""
+    latencies_ms = np.asarray(latencies, dtype=np.float64) * 1000
+    summary = {
+        "repeat": len(latencies_ms),
+        "latency_ms": {
+            "min": round(float(latencies_ms.min()), 4),
+            "mean": round(float(latencies_ms.mean()), 4),
+            "p50": round(float(np.percentile(latencies_ms, 50)), 4),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 4),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 4),
+            "max": round(float(latencies_ms.max()), 4),
+        },
+    }
+    total = latencies_ms.sum() / 1000
+    if rows is not None:
+        summary["throughput_rows_per_s"] = round(rows * len(latencies_ms) / total, 1)
+    else:
+        summary["throughput_ops_per_s"] = round(len(latencies_ms) / total, 1)
+    return summary
+
+
+def measure(func, repeat=1, setup=None, rows=None, memory=True):
+    """func を repeat 回実行して所要時間を計測し、追加で1回ピークメモリを計測
+
+    setup を渡すと毎回の実行前に呼び、その戻り値を func の引数にする
+    （setup の時間は計測しない）。func の標準出力は捨てる。
+    """
+    latencies = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            func(*args)
+            latencies.append(time.perf_counter() - started)
+    result = summarize(latencies, rows)
+
+    if memory:
+        args = setup() if setup else ()
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                func(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result["peak_memory_mb"] = round(peak / 2**20, 2)
+    return result
+
+
+def random_preferences(rng, df):
+    """ロスターの語彙から推薦の嗜好をランダムに作成"""
+    vocab = {
+        column: sorted({v for items in df[column] for v in items})
+        for column in ("streaming_genres", "game_genres", "personality_traits")
+    }
+    return {
+        "streaming_genre": rng.sample(vocab["streaming_genres"], rng.randint(0, 2)),
+        "game_genre": rng.sample(vocab["game_genres"], rng.randint(0, 2)),
+        "personality": rng.sample(vocab["personality_traits"], rng.randint(0, 2)),
+        "streaming_time": rng.choice(["", "昼", "夕方", "夜"]),
+        "gender": rng.choice(["", "女性", "男性"]),
+        "voice_type": rng.choice(["", "高音", "中音", "低音", "特殊"]),
+    }
+
+
+def run_size(n, repeat, memory, seed):
+    """n 名の合成データで各処理を計測"""
+    import app
+    from data.dataset import Dataset
+    from data.prepared_response import PreparedResponse
+    from data.result_cache import RecommendationCache
+    from data.roster_store import RosterStore, frame_memory_per_liver
+    from data.synthetic_data import create_synthetic_vtuber_data
+    from data.vtuber_data import (
+        encode_categorical_features,
+        get_cluster_characteristics,
+        perform_clustering,
+    )
+
+    results = {}
+    started = time.perf_counter()
+    raw = create_synthetic_vtuber_data(n, seed=seed)
+    print(f"  合成データ作成: {time.perf_counter() - started:.2f}秒")
+
+    results["encode_categorical_features"] = measure(
+        encode_categorical_features,
+        repeat=repeat,
+        setup=lambda: (raw.copy(),),
+        rows=n,
+        memory=memory,
+    )
+    encoded = encode_categorical_features(raw.copy())
+
+    results["perform_clustering"] = measure(
+        lambda df: perform_clustering(df, n_clusters=4),
+        repeat=repeat,
+        setup=lambda: (encoded.copy(),),
+        rows=n,
+        memory=memory,
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        df, clusters, pipeline, kmeans = perform_clustering(encoded.copy(), n_clusters=4)
+
+    results["get_cluster_characteristics"] = measure(
+        get_cluster_characteristics,
+        repeat=repeat,
+        setup=lambda: (df,),
+        rows=n,
+        memory=memory,
+    )
+
+    # 推薦はキャッシュを無効にして1件ずつの遅延を計測する
+    app.publish_dataset(Dataset.build(df, clusters, pipeline, kmeans))
+    app.recommendation_cache = RecommendationCache(maxsize=0)
+    rng = random.Random(seed)
+    queries = [random_preferences(rng, df) for _ in range(RECOMMENDATION_QUERIES)]
+    latencies = []
+    for preferences in queries:
+        started = time.perf_counter()
+        app.calculate_recommendations(preferences)
+        latencies.append(time.perf_counter() - started)
+    results["calculate_recommendations"] = summarize(latencies)
+    if memory:
+        results["calculate_recommendations"]["peak_memory_mb"] = measure(
+            lambda: [app.calculate_recommendations(p) for p in queries[:10]],
+            repeat=1,
+        )["peak_memory_mb"]
+
+    # /api/vtubers の本文の作成（ストアからの復元・JSONシリアライズ・圧縮）
+    roster = app.dataset.recommender.roster
+    results["vtubers_serialization"] = measure(
+        lambda: PreparedResponse(roster.records()),
+        repeat=repeat,
+        rows=n,
+        memory=memory,
+    )
+    results["vtubers_serialization"]["body_bytes"] = len(
+        app.dataset.vtubers_response.body
+    )
+
+    # 辞書エンコードしたロスターの作成とライバー1名あたりのメモリ
+    results["roster_store"] = measure(
+        RosterStore.from_frame,
+        repeat=repeat,
+        setup=lambda: (df,),
+        rows=n,
+        memory=memory,
+    )
+    results["roster_store"]["bytes_per_liver"] = {
+        "store": roster.memory_report()["bytes_per_liver"],
+        **frame_memory_per_liver(df),
+    }
+
+    return results
+
+
+def warm_up(seed):
+    """遅延読み込みされるライブラリを読み込んでおく（初回の計測に含めないため）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_size(100, repeat=1, memory=False, seed=seed)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, threshold):
+    """前回の結果と p50 を比較し、threshold 倍を超えて遅くなった項目を返す"""
+    regressions = []
+    for size, benchmarks in current["sizes"].items():
+        for name, result in benchmarks.items():
+            base = baseline.get("sizes", {}).get(size, {}).get(name)
+            if not base:
+                continue
+            before, after = base["latency_ms"]["p50"], result["latency_ms"]["p50"]
+            ratio = after / before if before > 0 else float("inf")
+            mark = "悪化" if ratio > threshold else ""
+            print(
+                f"  n={size:>8} {name:30s} {before:10.3f}ms -> {after:10.3f}ms"
+                f" ({ratio:5.2f}x) {mark}"
+            )
+            if ratio > threshold:
+                regressions.append((size, name, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="主要な処理のベンチマーク")
+    parser.add_argument(
+        "--sizes", nargs="+", default=["1k", "10k"], help="ライバー数（例: 1k 100k 1M）"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="各処理の計測回数")
+    parser.add_argument("--seed", type=int, default=42, help="合成データの乱数シード")
+    parser.add_argument("--output", help="結果のJSONの保存先")
+    parser.add_argument("--compare", help="比較する前回の結果のJSON")
+    parser.add_argument(
+        "--threshold", type=float, default=1.2, help="悪化とみなす p50 の倍率"
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="ピークメモリを計測しない（速く終わる）"
+    )
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, PROJECT_ROOT)
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "sizes": {},
+    }
+    warm_up(args.seed)
+    for size in args.sizes:
+        n = parse_size(size)
+        print(f"n={n} を計測中")
+        report["sizes"][str(n)] = run_size(n, args.repeat, not args.no_memory, args.seed)
+        for name, result in report["sizes"][str(n)].items():
+            latency = result["latency_ms"]
+            peak = result.get("peak_memory_mb")
+            print(
+                f"  {name:30s} p50={latency['p50']:10.3f}ms p95={latency['p95']:10.3f}ms"
+                + (f" peak={peak}MB" if peak is not None else "")
+            )
+        per_liver = report["sizes"][str(n)]["roster_store"]["bytes_per_liver"]
+        print(
+            f"  1名あたりのメモリ: ストア {per_liver['store']}バイト"
+            f" / DataFrame {per_liver['dataframe']}バイト"
+            f" / 辞書のリスト {per_liver['records']}バイト"
+        )
+    # プロセス全体の最大常駐メモリ（Linux は KB 単位）
+    report["max_rss_mb"] = round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+    )
+
+    output = args.output or os.path.join(
+        DEFAULT_OUTPUT_DIR, f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"{args.compare} との比較（閾値 {args.threshold}x）:")
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)}件の処理が遅くなっています")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
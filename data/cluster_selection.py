@@ -0,0 +1,209 @@
+# クラスタ数の自動選択（複数の k を並列に学習して比較する）
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.metrics import silhouette_score
+from threadpoolctl import threadpool_limits
+
+from data.vtuber_data import create_clusterer
+
+
+# ワーカープロセスが共有する特徴量行列（初期化時に一度だけ読み込む）
+_worker_matrix = None
+
+
+def _save_matrix(matrix, directory):
+    """特徴量行列をワーカーと共有するためにファイルへ書き出す"""
+    matrix = sparse.csr_matrix(matrix)
+    np.save(os.path.join(directory, "data.npy"), matrix.data)
+    np.save(os.path.join(directory, "indices.npy"), matrix.indices)
+    np.save(os.path.join(directory, "indptr.npy"), matrix.indptr)
+    return matrix.shape
+
+
+def _init_worker(directory, shape, n_threads):
+    """ワーカーの初期化: 特徴量行列をメモリマップで読み込む
+
+    copy-on-write のマップなのでページは全プロセスで共有され、sklearn の
+    疎行列処理が要求する書き込み可能な配列としても扱える。
+    """
+    global _worker_matrix
+    arrays = [
+        np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="c")
+        for name in ("data", "indices", "indptr")
+    ]
+    _worker_matrix = sparse.csr_matrix(tuple(arrays), shape=shape)
+    # プロセス数 × OpenMP スレッド数がコア数を超えないようにする
+    threadpool_limits(n_threads)
+
+
+def _fit_k(X, k, clusterer_options):
+    """1つの k で学習し、モデルと所要時間を返す"""
+    started = time.perf_counter()
+    model = create_clusterer(k, **clusterer_options)
+    model.fit(X)
+    return model, time.perf_counter() - started
+
+
+def _score_labels(X, labels, silhouette_sample_size):
+    """クラスタ割り当てのシルエット係数と所要時間を返す（クラスタが1つなら None）"""
+    started = time.perf_counter()
+    if len(np.unique(labels)) > 1:
+        sample_size = None
+        if silhouette_sample_size and X.shape[0] > silhouette_sample_size:
+            sample_size = silhouette_sample_size
+        silhouette = float(
+            silhouette_score(X, labels, sample_size=sample_size, random_state=42)
+        )
+    else:
+        silhouette = None
+    return silhouette, time.perf_counter() - started
+
+
+def _fit_k_worker(k, clusterer_options):
+    return _fit_k(_worker_matrix, k, clusterer_options)
+
+
+def _score_labels_worker(labels, silhouette_sample_size):
+    return _score_labels(_worker_matrix, labels, silhouette_sample_size)
+
+
+def _fitted_report(k, model, fit_seconds):
+    return {
+        "k": k,
+        "status": "fitted",
+        "inertia": float(model.inertia_),
+        "fit_seconds": round(fit_seconds, 4),
+    }
+
+
+def _scored_report(report, silhouette, score_seconds):
+    return {
+        **report,
+        "status": "ok",
+        "silhouette": silhouette,
+        "score_seconds": round(score_seconds, 4),
+    }
+
+
+def _choose(models, reports, fallback_k):
+    """選ぶ k と選び方を返す
+
+    シルエット係数が最大の k（同点なら慣性が小さい方）を選ぶ。評価が
+    間に合わなかった場合は、学習済みの k のうち fallback_k に最も近いものを選ぶ。
+    """
+    scored = [k for k in models if reports[k].get("silhouette") is not None]
+    if scored:
+        best = max(scored, key=lambda k: (reports[k]["silhouette"], -reports[k]["inertia"]))
+        return best, "silhouette"
+    if models:
+        target = fallback_k if fallback_k is not None else min(models)
+        return min(models, key=lambda k: (abs(k - target), k)), "unscored"
+    return None, None
+
+
+def select_n_clusters(
+    X,
+    k_values=range(2, 11),
+    backend=None,
+    batch_size=1024,
+    max_iter=None,
+    n_jobs=None,
+    time_budget=30.0,
+    silhouette_sample_size=2000,
+    fallback_k=None,
+):
+    """複数のクラスタ数で学習し、シルエット係数が最も高いモデルを選ぶ
+
+    各 k の学習とシルエット係数の計算はプロセスプールで並列に実行し、特徴量
+    行列はメモリマップで全ワーカーが共有する。time_budget 秒を過ぎた時点で
+    未完了の処理は打ち切る。ライバー数が silhouette_sample_size を超える場合は
+    サンプリングしたシルエット係数で評価する。
+    学習と評価は別々に実行するため、期限までに評価が間に合わなくても学習済みの
+    モデルがあればそれを返す（fallback_k に最も近い k。fallback_k は最初に学習する）。
+
+    戻り値は (選んだモデル, レポート)。期限内に学習できた k がなければモデルは None。
+    """
+    started = time.perf_counter()
+    deadline = started + time_budget if time_budget is not None else None
+    n_rows = X.shape[0]
+    # シルエット係数は 2 <= k <= n_rows - 1 でのみ定義される
+    k_values = sorted({int(k) for k in k_values if 2 <= int(k) < n_rows})
+    # 評価が間に合わなかった場合に使う k から学習する
+    order = sorted(k_values, key=lambda k: (k != fallback_k, k))
+    clusterer_options = {"backend": backend, "batch_size": batch_size, "max_iter": max_iter}
+
+    def expired():
+        return deadline is not None and time.perf_counter() >= deadline
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, max(len(k_values), 1))
+    models = {}
+    reports = {k: {"k": k, "status": "timeout"} for k in k_values}
+
+    if n_jobs <= 1:
+        # 1プロセスの場合は順に学習・評価し、処理ごとに期限を確認する
+        for k in order:
+            if expired():
+                break
+            model, fit_seconds = _fit_k(X, k, clusterer_options)
+            models[k] = model
+            reports[k] = _fitted_report(k, model, fit_seconds)
+            if expired():
+                break
+            silhouette, score_seconds = _score_labels(
+                X, model.labels_, silhouette_sample_size
+            )
+            reports[k] = _scored_report(reports[k], silhouette, score_seconds)
+    else:
+        directory = tempfile.mkdtemp(prefix="vtuber-auto-k-")
+        context = multiprocessing.get_context("spawn")
+        pool = None
+        try:
+            shape = _save_matrix(X, directory)
+            n_threads = max(1, (os.cpu_count() or 1) // n_jobs)
+            pool = context.Pool(
+                n_jobs, initializer=_init_worker, initargs=(directory, shape, n_threads)
+            )
+            fitting = {
+                k: pool.apply_async(_fit_k_worker, (k, clusterer_options)) for k in order
+            }
+            scoring = {}
+            while (fitting or scoring) and not expired():
+                for k in [k for k, result in fitting.items() if result.ready()]:
+                    model, fit_seconds = fitting.pop(k).get()
+                    models[k] = model
+                    reports[k] = _fitted_report(k, model, fit_seconds)
+                    scoring[k] = pool.apply_async(
+                        _score_labels_worker, (model.labels_, silhouette_sample_size)
+                    )
+                for k in [k for k, result in scoring.items() if result.ready()]:
+                    silhouette, score_seconds = scoring.pop(k).get()
+                    reports[k] = _scored_report(reports[k], silhouette, score_seconds)
+                time.sleep(0.01)
+        finally:
+            # 期限切れで実行中の処理はワーカーごと終了させる
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    chosen_k, chosen_by = _choose(models, reports, fallback_k)
+    report = {
+        "chosen_k": chosen_k,
+        "chosen_by": chosen_by,
+        "elapsed_seconds": round(time.perf_counter() - started, 4),
+        "time_budget": time_budget,
+        "n_jobs": n_jobs,
+        "silhouette_sample_size": (
+            silhouette_sample_size
+            if silhouette_sample_size and n_rows > silhouette_sample_size
+            else None
+        ),
+        "candidates": [reports[k] for k in k_values],
+    }
+    return models.get(chosen_k), report
@@ -0,0 +1,102 @@
+# 推薦サービスが参照するデータセット
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from data.prepared_response import PreparedResponse
+from data.projection import MapProjection
+from data.recommender import RecommendationEngine
+from data.similarity import SimilarityIndex
+
+
+# プロセス内で単調増加するデータセットのバージョン番号
+_versions = itertools.count(1)
+
+
+def _cluster_labels(df):
+    """整数のクラスタ番号の列（なければ None）"""
+    if "cluster" not in df.columns or df["cluster"].dtype.kind not in "iu":
+        return None
+    return df["cluster"].to_numpy()
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """ロスター・クラスタリング結果・推薦エンジンをまとめた不変のデータセット
+
+    再読み込み時は新しい Dataset を作成し、参照の代入1回で差し替える。
+    読み出し側は参照を一度ローカル変数に取れば、途中で差し替えが起きても
+    同じバージョンの一貫したデータだけを見ることになる。
+    """
+
+    df: Any
+    clusters: Any
+    scaler: Any
+    kmeans: Any
+    recommender: RecommendationEngine
+    vtubers_response: PreparedResponse
+    similarity: Any
+    version: int
+    created_at: float = field(default_factory=time.time)
+    # 共有データセット（data/shared_dataset.py）では df・scaler・kmeans を持たず、
+    # 必要な時にこのスナップショットから読み込む
+    snapshot_dir: Optional[str] = None
+    # 地図（/api/map）用のPCAの座標（特徴量行列がない場合は None）
+    projection: Optional[MapProjection] = None
+
+    @classmethod
+    def build(cls, df, clusters, scaler, kmeans=None):
+        """ロスターとクラスタリング結果からデータセットを作成"""
+        recommender = RecommendationEngine(df)
+        # 類似ライバーの索引はクラスタリングに使った特徴量行列から作成する
+        matrix = getattr(scaler, "matrix_", None)
+        similarity = (
+            SimilarityIndex(df, matrix, recommender.roster)
+            if matrix is not None
+            else None
+        )
+        # 地図の座標もバージョンごとに一度だけ計算する
+        projection = (
+            MapProjection.from_features(matrix, _cluster_labels(df))
+            if matrix is not None
+            else None
+        )
+        return cls(
+            df=df,
+            clusters=clusters,
+            scaler=scaler,
+            kmeans=kmeans,
+            recommender=recommender,
+            # /api/vtubers の本文はバージョンごとに一度だけ作成する
+            vtubers_response=PreparedResponse(recommender.roster.records()),
+            similarity=similarity,
+            version=next(_versions),
+            projection=projection,
+        )
+
+    def training_state(self):
+        """差分更新・再学習に使う (df, clusters, scaler, kmeans) を返す
+
+        共有データセットの場合は世代ごとに保存したスナップショットから読み込む
+        （スナップショットがない場合はロスターから df だけを復元する）。
+        """
+        if self.df is not None:
+            return self.df, self.clusters, self.scaler, self.kmeans
+
+        from data.snapshot import SnapshotError, load_snapshot
+
+        if self.snapshot_dir is not None:
+            try:
+                df, clusters, scaler, kmeans, _ = load_snapshot(self.snapshot_dir)
+                return df, clusters, scaler, kmeans
+            except SnapshotError as e:
+                print(f"共有データセットのスナップショットを読み込めません: {e}")
+
+        import pandas as pd
+
+        df = pd.DataFrame(
+            self.recommender.roster.records(),
+            columns=self.recommender.roster.column_names,
+        )
+        return df, self.clusters, None, None
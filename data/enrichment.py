@@ -0,0 +1,221 @@
+# MCPサーバーから取得したライバーデータの補完（取得した全件を列単位でまとめて処理）
+import re
+from typing import Dict, List
+
+import numpy as np
+
+from data.lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+# 名前にこれらの文字が含まれる場合は女性と推定する（簡易版）
+FEMININE_NAME_PATTERN = re.compile("[美華花姫音愛香桜月星]")
+
+# アバターカラーテーマの候補（名前のダイジェストで選ぶ）
+COLOR_THEMES = [
+    "白・青",
+    "緑・茶",
+    "黒・青",
+    "紫・白",
+    "ピンク・白",
+    "青・白",
+    "白・水色",
+    "オレンジ・白",
+    "赤・黒",
+    "灰・黒",
+]
+
+# 配信ジャンル -> (スキル列, ジャンルがある場合の値, ない場合の値)
+GENRE_SKILLS = [
+    ("歌", "singing_skill", 8, 5),
+    ("ゲーム", "gaming_skill", 8, 5),
+    ("雑談", "talk_skill", 9, 6),
+]
+
+DEFAULT_SUBSCRIBER_COUNT = 500000
+# 登録者数の5-10%を視聴者数とする
+VIEWER_RATIO = 0.07
+
+
+# FNV-1a（64ビット）のパラメータ
+FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def stable_digests(texts) -> np.ndarray:
+    """文字列ごとの安定したダイジェスト（64ビット整数の配列）
+
+    組み込みの hash() はプロセスごとにソルトが変わるため使わず、UTF-8 の
+    バイト列の FNV-1a を全件まとめて（バイト位置ごとに配列演算で）計算する。
+    プロセスや再起動によらず同じ値になる。
+    """
+    texts = [text if type(text) is str else str(text) for text in texts]
+    n = len(texts)
+    if n == 0:
+        return np.empty(0, dtype=np.uint64)
+
+    # NUL区切りで連結して一度にエンコードし、区切り位置から各文字列のバイト列を得る
+    # （文字列中のNULは区切りと区別できないため取り除く）
+    joined = "\0".join(texts)
+    if joined.count("\0") != n - 1:
+        joined = "\0".join(text.replace("\0", "") for text in texts)
+    buffer = np.frombuffer((joined + "\0").encode("utf-8"), dtype=np.uint8)
+    ends = np.flatnonzero(buffer == 0)
+    starts = np.r_[0, ends[:-1] + 1].astype(np.int64)
+    lengths = ends - starts
+
+    # バイト数の多い順に並べ、右側を0で埋めた 行 × 最大長 の行列にする
+    # （j バイト目を持つ行が常に先頭の連続した範囲になる）
+    order = np.argsort(-lengths, kind="stable")
+    sorted_lengths = lengths[order]
+    width = int(sorted_lengths[0])
+    data = np.zeros((n, width), dtype=np.uint8)
+    rows = np.repeat(np.arange(n), sorted_lengths)
+    offsets = np.cumsum(sorted_lengths) - sorted_lengths
+    columns = np.arange(sorted_lengths.sum()) - np.repeat(offsets, sorted_lengths)
+    data[rows, columns] = buffer[np.repeat(starts[order], sorted_lengths) + columns]
+
+    digests = np.full(n, FNV_OFFSET, dtype=np.uint64)
+    # j バイト目を持つ行の数
+    counts = np.searchsorted(-sorted_lengths, -np.arange(width), side="left")
+    for j, k in enumerate(counts):
+        digests[:k] = (digests[:k] ^ data[:k, j]) * FNV_PRIME
+
+    # 下位ビットの偏りをなくすため最後にビットを混ぜる（murmur3 の fmix64）
+    digests ^= digests >> np.uint64(33)
+    digests *= np.uint64(0xFF51AFD7ED558CCD)
+    digests ^= digests >> np.uint64(33)
+
+    result = np.empty_like(digests)
+    result[order] = digests
+    return result
+
+
+def _missing(df, column: str):
+    """列がない・値が空（None / NaN / 空文字 / 0 / 空リスト）の行"""
+    if column not in df.columns:
+        return pd.Series(True, index=df.index)
+    values = df[column]
+    return values.isna() | ~values.astype(bool)
+
+
+def _genre_membership(lists, genres):
+    """リストの列の各行に各ジャンルが含まれるか（ジャンル -> bool配列）
+
+    リストを一度だけ連結し、ジャンルごとに配列の比較で判定する。
+    リストでない値は空とみなす。
+    """
+    lists = [items if isinstance(items, list) else [] for items in lists]
+    lengths = np.fromiter((len(items) for items in lists), np.int64, len(lists))
+    flat = np.empty(int(lengths.sum()), dtype=object)
+    flat[:] = [value for items in lists for value in items]
+    rows = np.repeat(np.arange(len(lists)), lengths)
+    membership = {}
+    for genre in genres:
+        hit = np.zeros(len(lists), dtype=bool)
+        hit[rows[flat == genre]] = True
+        membership[genre] = hit
+    return membership
+
+
+def enhance_vtuber_frame(df):
+    """ライバーデータを推薦システム用に補完（1行1名の DataFrame をまとめて処理）
+
+    欠損している性別・声質・配信時間・登録者数・平均視聴者数・アバターカラー・
+    デビュー日を補完し、配信頻度・コラボ頻度と配信ジャンルからのスキル値を設定する。
+    結果は入力だけで決まる（プロセスや実行ごとに変わらない）。
+    """
+    if len(df) == 0:
+        return df.copy()
+    df = df.reset_index(drop=True).copy()
+    n = len(df)
+    names = (
+        df["name"].fillna("").astype(str)
+        if "name" in df.columns
+        else pd.Series("", index=df.index)
+    )
+
+    # 性別は名前の文字から推定する（欠損している行だけ判定する）
+    missing = _missing(df, "gender")
+    if missing.any():
+        feminine = names[missing].str.contains(FEMININE_NAME_PATTERN)
+        guessed = pd.Series("男性", index=df.index, dtype=object)
+        guessed[missing] = np.where(feminine, "女性", "男性")
+        df["gender"] = df["gender"].where(~missing, guessed) if "gender" in df else guessed
+
+    # 声質は性別から推定する
+    missing = _missing(df, "voice_type")
+    if missing.any():
+        guessed = np.where(df["gender"] == "女性", "高音", "低音")
+        df["voice_type"] = (
+            df["voice_type"].where(~missing, guessed) if "voice_type" in df else guessed
+        )
+
+    for column, default in (
+        ("main_streaming_time", "夜"),
+        ("subscriber_count", DEFAULT_SUBSCRIBER_COUNT),
+    ):
+        missing = _missing(df, column)
+        if column not in df.columns:
+            df[column] = default
+        elif missing.any():
+            df[column] = df[column].where(~missing, default)
+
+    missing = _missing(df, "average_viewers")
+    if missing.any():
+        subscribers = pd.to_numeric(df["subscriber_count"], errors="coerce")
+        guessed = np.trunc(subscribers.to_numpy(dtype=np.float64) * VIEWER_RATIO)
+        viewers = df["average_viewers"] if "average_viewers" in df else pd.Series(
+            np.nan, index=df.index
+        )
+        df["average_viewers"] = viewers.astype(object).where(~missing, guessed)
+
+    # 配信頻度・コラボ頻度は固定値、スキル値は配信ジャンルから推定する
+    df["streaming_frequency"] = np.full(n, 4, dtype=np.int64)  # 週4回
+    df["collab_frequency"] = np.full(n, 3, dtype=np.int64)  # 月3回
+    genres = df["streaming_genres"] if "streaming_genres" in df.columns else [None] * n
+    membership = _genre_membership(genres, [genre for genre, *_ in GENRE_SKILLS])
+    for genre, column, present, absent in GENRE_SKILLS:
+        df[column] = np.where(membership[genre], present, absent).astype(np.int64)
+
+    # アバターカラーテーマは名前の安定したダイジェストで選ぶ
+    missing = _missing(df, "avatar_color_theme")
+    if missing.any():
+        themes = np.array(COLOR_THEMES, dtype=object)
+        digests = stable_digests(names[missing])
+        guessed = pd.Series(None, index=df.index, dtype=object)
+        guessed[missing] = themes[digests % np.uint64(len(COLOR_THEMES))]
+        df["avatar_color_theme"] = (
+            df["avatar_color_theme"].where(~missing, guessed)
+            if "avatar_color_theme" in df
+            else guessed
+        )
+
+    missing = _missing(df, "debut_date")
+    if "debut_date" not in df.columns:
+        df["debut_date"] = "2018-01-01"
+    elif missing.any():
+        df["debut_date"] = df["debut_date"].where(~missing, "2018-01-01")
+
+    # 補完した数値列は整数で表せる場合は整数型にする
+    for column in ("subscriber_count", "average_viewers"):
+        values = pd.to_numeric(df[column], errors="coerce")
+        if values.notna().all() and (values == np.trunc(values)).all():
+            df[column] = values.astype(np.int64)
+
+    return df
+
+
+def enhance_vtubers(vtubers: List[Dict]):
+    """ライバーデータのリストを補完した DataFrame を返す"""
+    return enhance_vtuber_frame(pd.DataFrame(vtubers))
+
+
+if __name__ == "__main__":
+    # テスト実行
+    sample = [
+        {"name": "月ノ美兎", "streaming_genres": ["雑談", "ゲーム"]},
+        {"name": "剣持刀也", "gender": "男性", "subscriber_count": 380000},
+        {"name": "テスト", "gender": "", "avatar_color_theme": "赤・黒"},
+    ]
+    print(enhance_vtubers(sample).to_string())
@@ -0,0 +1,208 @@
+# 特徴量のスキーマと特徴量行列の作成
+import copy
+import json
+
+import numpy as np
+
+from data.lazy_imports import lazy_import
+
+# 読み込みに時間がかかるため初回使用時に読み込む
+sparse = lazy_import("scipy.sparse")
+preprocessing = lazy_import("sklearn.preprocessing")
+
+
+# クラスタリングに使う数値特徴量
+NUMERICAL_FEATURES = [
+    "subscriber_count",
+    "average_viewers",
+    "streaming_frequency",
+    "collab_frequency",
+    "singing_skill",
+    "gaming_skill",
+    "talk_skill",
+    "gender_encoded",
+    "voice_type_encoded",
+    "main_streaming_time_encoded",
+]
+
+# ワンホットエンコードの対象列: (リスト列, 列名の接頭辞)
+MULTI_LABEL_COLUMNS = [
+    ("streaming_genres", "streaming_"),
+    ("game_genres", "game_"),
+    ("personality_traits", "personality_"),
+]
+
+
+class MultiLabelVocabulary:
+    """複数値の列（配信ジャンル・ゲームジャンル・性格特性）の語彙
+
+    値の並び順は決定的で、新しい値は末尾に追加されるため既存の値の列番号は
+    変わらない。JSONに保存して、別のプロセスで新しいライバーのエンコードに
+    再利用できる。
+    """
+
+    def __init__(self, values=None):
+        # リスト列 -> 値の並び
+        self.values = {column: [] for column, _ in MULTI_LABEL_COLUMNS}
+        self._positions = {column: {} for column, _ in MULTI_LABEL_COLUMNS}
+        for column, column_values in (values or {}).items():
+            self._append(column, column_values)
+
+    def _append(self, column, new_values):
+        positions = self._positions[column]
+        for value in new_values:
+            if value not in positions:
+                positions[value] = len(self.values[column])
+                self.values[column].append(value)
+
+    def update(self, df):
+        """ロスターに現れた新しい値を語彙の末尾に追加（追加した値の数を返す）"""
+        added = 0
+        for column, _ in MULTI_LABEL_COLUMNS:
+            positions = self._positions[column]
+            new_values = set()
+            for values in df[column]:
+                if isinstance(values, (list, tuple)):
+                    new_values.update(v for v in values if v not in positions)
+            # 新しい値同士は文字列順に並べて決定的にする
+            self._append(column, sorted(new_values, key=str))
+            added += len(new_values)
+        return added
+
+    @classmethod
+    def from_roster(cls, df):
+        """エンコード済みロスターのワンホット列の並びから語彙を復元"""
+        column_order = {column: i for i, column in enumerate(df.columns)}
+        vocabulary = cls()
+        for column, prefix in MULTI_LABEL_COLUMNS:
+            values = set()
+            for items in df[column]:
+                if isinstance(items, (list, tuple)):
+                    values.update(items)
+            ordered = sorted(
+                values,
+                key=lambda v: (column_order.get(f"{prefix}{v}", len(column_order)), str(v)),
+            )
+            vocabulary._append(column, ordered)
+        return vocabulary
+
+    def copy(self):
+        return MultiLabelVocabulary(
+            {column: list(values) for column, values in self.values.items()}
+        )
+
+    def feature_columns(self):
+        """ワンホット列名（語彙の順）"""
+        return [
+            f"{prefix}{value}"
+            for column, prefix in MULTI_LABEL_COLUMNS
+            for value in self.values[column]
+        ]
+
+    def transform_column(self, df, column):
+        """リスト列を疎なマルチホット行列（CSR, uint8）に変換"""
+        positions = self._positions[column]
+        indptr = [0]
+        indices = []
+        for values in df[column]:
+            if isinstance(values, (list, tuple)):
+                row = {positions[v] for v in values if v in positions}
+                indices.extend(sorted(row))
+            indptr.append(len(indices))
+
+        return sparse.csr_matrix(
+            (
+                np.ones(len(indices), dtype=np.uint8),
+                np.asarray(indices, dtype=np.int32),
+                np.asarray(indptr, dtype=np.int64),
+            ),
+            shape=(len(indptr) - 1, len(self.values[column])),
+        )
+
+    def transform(self, df):
+        """全てのリスト列をまとめた疎なマルチホット行列（列は feature_columns の順）"""
+        blocks = [self.transform_column(df, column) for column, _ in MULTI_LABEL_COLUMNS]
+        return sparse.hstack(blocks, format="csr", dtype=np.uint8)
+
+    def to_dict(self):
+        return {column: list(values) for column, values in self.values.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({column: data.get(column, []) for column, _ in MULTI_LABEL_COLUMNS})
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+class FeaturePipeline:
+    """明示的な特徴量スキーマから特徴量行列を作成するパイプライン
+
+    数値列は StandardScaler で標準化し、マルチホット列は疎行列のまま列ごとの
+    標準偏差で割る（平均を引かないので疎性が保たれる。KMeans のユークリッド距離は
+    平行移動に依存しないため、全列を標準化した場合と同じクラスタになる）。
+    平行移動に依存する処理（コサイン類似度・PCA）は列平均を引いてから使う。
+    ロスター全体の DataFrame はコピーせず、必要な列だけを読む。
+    """
+
+    def __init__(self, numeric_columns, vocabulary):
+        self.numeric_columns = list(numeric_columns)
+        self.vocabulary = vocabulary
+        self.numeric_scaler = preprocessing.StandardScaler()
+        self.multi_hot_scaler = preprocessing.StandardScaler(with_mean=False)
+        # 学習時に作成した特徴量行列（CSR, float64）
+        self.matrix_ = None
+
+    @classmethod
+    def from_roster(cls, df):
+        """ロスターの列と語彙から特徴量スキーマを決める"""
+        numeric_columns = [c for c in NUMERICAL_FEATURES if c in df.columns]
+        return cls(numeric_columns, MultiLabelVocabulary.from_roster(df))
+
+    @property
+    def feature_columns(self):
+        """特徴量行列の列名"""
+        return self.numeric_columns + self.vocabulary.feature_columns()
+
+    @property
+    def n_features(self):
+        return len(self.feature_columns)
+
+    def _blocks(self, df):
+        numeric = df[self.numeric_columns].fillna(0).to_numpy(dtype=np.float64)
+        multi_hot = self.vocabulary.transform(df).astype(np.float64)
+        return numeric, multi_hot
+
+    def _combine(self, numeric, multi_hot):
+        return sparse.hstack(
+            [sparse.csr_matrix(numeric), multi_hot], format="csr", dtype=np.float64
+        )
+
+    def fit_transform(self, df):
+        """スケーラーを学習して特徴量行列を作成し、matrix_ に保持する"""
+        numeric, multi_hot = self._blocks(df)
+        numeric = self.numeric_scaler.fit_transform(numeric)
+        if multi_hot.shape[1] > 0:
+            multi_hot = self.multi_hot_scaler.fit_transform(multi_hot)
+        self.matrix_ = self._combine(numeric, multi_hot)
+        return self.matrix_
+
+    def transform(self, df):
+        """学習済みのスケーラーで特徴量行列を作成（語彙にない値は無視される）"""
+        numeric, multi_hot = self._blocks(df)
+        numeric = self.numeric_scaler.transform(numeric)
+        if multi_hot.shape[1] > 0:
+            multi_hot = self.multi_hot_scaler.transform(multi_hot)
+        return self._combine(numeric, multi_hot)
+
+    def with_matrix(self, df):
+        """スケーラーはそのままで、df の特徴量行列を持つ複製を返す"""
+        pipeline = copy.copy(self)
+        pipeline.matrix_ = self.transform(df)
+        return pipeline
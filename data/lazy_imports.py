@@ -0,0 +1,42 @@
+# 重い依存ライブラリを初回使用時に読み込むための仕組み
+import importlib
+
+
+class LazyModule:
+    """属性に初めてアクセスした時点でモジュールを読み込むプロキシ
+
+    pandas や scikit-learn のように読み込みに時間がかかるモジュールを
+    モジュール変数として宣言しておき、実際に使う処理が呼ばれるまで
+    読み込みを遅らせる（アプリの起動を速くするため）。
+    """
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            # import_module はインポートロックで保護されているため複数スレッドからでも安全
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+        return module
+
+    @property
+    def loaded(self):
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<LazyModule {self.__dict__['_name']!r} ({state})>"
+
+
+def lazy_import(name):
+    """name のモジュールを初回使用時に読み込むプロキシを返す"""
+    return LazyModule(name)
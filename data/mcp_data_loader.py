@@ -1,98 +1,138 @@
+import hashlib
+import itertools
 import json
+import math
+import os
+import random
 import re
-import subprocess
-import sys
+import threading
 import time
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Iterator, Optional
+
+import numpy as np
+
+from data.enrichment import enhance_vtubers, stable_digests
+from data.lazy_imports import lazy_import
+from data.mcp_session import MCPSession, MCPTimeoutError
+from data.metrics import MCP_BATCHES, STAGE_DURATION, stage_timer
+
+pd = lazy_import("pandas")
+
+# 取得したライバーを補完してから返す単位（名）。最初のチャンクを早く返すため
+# 小さく始め、チャンクを返すたびに MAX_CHUNK_SIZE まで倍にしていく
+DEFAULT_CHUNK_SIZE = 20
+MAX_CHUNK_SIZE = 2000
+
+# 詳細取得の同時実行数と1秒あたりのリクエスト数の上限（wikiへの負荷に合わせて
+# 環境変数 VTUBER_MCP_MAX_CONCURRENCY・VTUBER_MCP_REQUESTS_PER_SECOND で変更可能）
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("VTUBER_MCP_MAX_CONCURRENCY", "3"))
+DEFAULT_REQUESTS_PER_SECOND = float(
+    os.environ.get("VTUBER_MCP_REQUESTS_PER_SECOND", "0.5")
+)
+
+# 差分更新のたびに詳細を取得し直す既存ライバーの割合（内容の変更を拾うため。
+# 環境変数 VTUBER_MCP_RECHECK_FRACTION で変更可能、0で再確認しない）
+DEFAULT_RECHECK_FRACTION = float(os.environ.get("VTUBER_MCP_RECHECK_FRACTION", "0.1"))
+
+# 再確認する範囲の順番（再起動のたびに同じ範囲から始めないよう起動時刻から始める）
+_recheck_rounds = itertools.count(int(time.time()))
+
+
+def vtuber_content_hash(vtuber: Dict) -> str:
+    """MCPサーバーから取得した生データの内容ハッシュ（変更検知用）"""
+    canonical = json.dumps(
+        vtuber, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str
+    )
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class TokenBucket:
+    """トークンバケット方式のレート制限（rateは1秒あたりの補充数）"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """トークンを1つ取得できるまで待機"""
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
 
 class MCPDataLoader:
     """MCPサーバーからにじさんじライバーデータを取得するクラス"""
 
-    def __init__(self):
-        import os
-
+    def __init__(
+        self,
+        server_command: Optional[List[str]] = None,
+        session: Optional[MCPSession] = None,
+    ):
         # プロジェクトのルートディレクトリを取得
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.project_root = project_root
         self.mcp_server_path = os.path.join(
             project_root, "mcp-server", "build", "index.js"
         )
+        self.server_command = server_command or ["node", self.mcp_server_path]
+
+        # 常駐セッション（with文の中、または外部から渡された場合のみ）
+        self.session = session
+        self._owns_session = False
+
+    def open_session(self) -> MCPSession:
+        """MCPサーバーとのセッションを作成"""
+        return MCPSession(self.server_command, cwd=self.project_root)
+
+    def __enter__(self):
+        if self.session is None:
+            self.session = self.open_session()
+            self._owns_session = True
+        self.session.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._owns_session:
+            self.session.close()
+            self.session = None
+            self._owns_session = False
 
     def call_mcp_tool(
         self, tool_name: str, arguments: Dict[str, Any] = None
     ) -> Optional[Dict]:
-        """MCPツールを呼び出す"""
-        if arguments is None:
-            arguments = {}
+        """MCPツールを呼び出す
 
-        try:
-            # MCPサーバーを起動してツールを呼び出す
-            cmd = ["node", self.mcp_server_path]
-            process = subprocess.Popen(
-                cmd,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
-
-            # MCP初期化メッセージ
-            init_message = {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "initialize",
-                "params": {
-                    "protocolVersion": "2024-11-05",
-                    "capabilities": {},
-                    "clientInfo": {"name": "recommend-vtuber", "version": "1.0.0"},
-                },
-            }
-
-            # ツール呼び出しメッセージ
-            tool_message = {
-                "jsonrpc": "2.0",
-                "id": 2,
-                "method": "tools/call",
-                "params": {"name": tool_name, "arguments": arguments},
-            }
-
-            # メッセージを送信
-            input_data = (
-                json.dumps(init_message) + "\n" + json.dumps(tool_message) + "\n"
-            )
-            stdout, stderr = process.communicate(input=input_data, timeout=30)
-
-            if process.returncode != 0:
-                print(f"MCP error: {stderr}")
-                return None
-
-            # レスポンスを解析
-            lines = stdout.strip().split("\n")
-            for line in lines:
-                if line.strip():
-                    try:
-                        response = json.loads(line)
-                        if response.get("id") == 2 and "result" in response:
-                            content = response["result"].get("content", [])
-                            if content and len(content) > 0:
-                                return json.loads(content[0]["text"])
-                    except json.JSONDecodeError:
-                        continue
+        失敗した場合は例外（タイムアウトは MCPTimeoutError）をそのまま送出する。
+        再試行するかどうかは呼び出し側で決める。
+        """
+        if self.session is not None:
+            return self.session.call_tool(tool_name, arguments)
 
-            return None
-
-        except subprocess.TimeoutExpired:
-            process.kill()
-            print("MCP call timed out")
-            return None
-        except Exception as e:
-            print(f"Error calling MCP tool: {e}")
-            return None
+        # セッション外からの呼び出しは1回限りのサーバーで処理する
+        with self.open_session() as session:
+            return session.call_tool(tool_name, arguments)
 
     def get_vtuber_list(self) -> List[str]:
         """ライバー一覧を取得"""
         try:
-            result = self.call_mcp_tool("get_vtuber_list")
+            with stage_timer("list_fetch"):
+                result = self.call_mcp_tool("get_vtuber_list")
             if result and "vtubers" in result:
                 # 日本語名のライバーのみフィルタリング
                 japanese_vtubers = []
@@ -120,130 +160,308 @@ class MCPDataLoader:
             print(f"Error getting vtuber list: {e}")
             return []
 
-    def get_vtuber_details_batch(
-        self, names: List[str], batch_size: int = 10
-    ) -> List[Dict]:
-        """複数のライバーの詳細情報を取得"""
-        all_vtubers = []
-
-        # バッチ処理で取得
-        for i in range(0, len(names), batch_size):
-            batch_names = names[i : i + batch_size]
-            print(f"Fetching batch {i // batch_size + 1}: {len(batch_names)} vtubers")
-
+    def fetch_batch(
+        self,
+        batch_names: List[str],
+        batch_number: int,
+        rate_limiter: "TokenBucket",
+        max_retries: int = 2,
+        retry_backoff: float = 1.0,
+    ) -> Optional[List[Dict]]:
+        """1バッチ分の詳細情報を取得（失敗時はバックオフしながら再試行）"""
+        for attempt in range(max_retries + 1):
+            if attempt > 0:
+                # 指数バックオフ（同時に再試行が重ならないよう揺らぎを加える）
+                delay = retry_backoff * (2 ** (attempt - 1))
+                time.sleep(delay + random.uniform(0, retry_backoff))
+                print(f"Retrying batch {batch_number} ({attempt}/{max_retries})")
+
+            rate_limiter.acquire()
             try:
                 result = self.call_mcp_tool(
                     "get_multiple_vtuber_details",
-                    {"names": batch_names, "limit": batch_size},
+                    {"names": batch_names, "limit": len(batch_names)},
                 )
-
-                if result and "vtubers" in result:
-                    all_vtubers.extend(result["vtubers"])
-
-                # レート制限を避けるため少し待機
-                time.sleep(2)
-
+            except MCPTimeoutError:
+                print(f"MCP call timed out (batch {batch_number})")
+                continue
             except Exception as e:
-                print(f"Error fetching batch {i // batch_size + 1}: {e}")
+                print(f"Error fetching batch {batch_number}: {e}")
                 continue
 
+            if result and "vtubers" in result:
+                return result["vtubers"]
+
+        print(f"Failed to fetch batch {batch_number}")
+        return None
+
+    def iter_vtuber_details(
+        self,
+        names: List[str],
+        batch_size: int = 10,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+        max_retries: int = 2,
+        retry_backoff: float = 1.0,
+        on_batch_done: Optional[Callable[[int, int], None]] = None,
+    ) -> Iterator[List[Dict]]:
+        """複数のライバーの詳細情報をバッチごとに返すジェネレータ
+
+        バッチを最大 max_concurrency 件まで並行して取得し、元の順序で先頭から
+        揃ったバッチをすぐに返す（呼び出し側は後続のバッチの取得中に処理を
+        進められる）。wikiへの負荷は requests_per_second を上限とするトークン
+        バケットで制御し、失敗したバッチは再試行後も取得できなければ読み飛ばす。
+        on_batch_done にはバッチが終わるたびに (完了数, 全バッチ数) が渡される。
+        """
+        batches = [
+            names[i : i + batch_size] for i in range(0, len(names), batch_size)
+        ]
+        rate_limiter = TokenBucket(requests_per_second)
+        done_count = [0]
+        done_lock = threading.Lock()
+
+        def fetch(index):
+            batch_names = batches[index]
+            print(f"Fetching batch {index + 1}: {len(batch_names)} vtubers")
+            with stage_timer("detail_batch"):
+                vtubers = self.fetch_batch(
+                    batch_names, index + 1, rate_limiter, max_retries, retry_backoff
+                )
+            MCP_BATCHES.inc(result="ok" if vtubers is not None else "failed")
+            if on_batch_done is not None:
+                with done_lock:
+                    done_count[0] += 1
+                    on_batch_done(done_count[0], len(batches))
+            return vtubers
+
+        # バッチ処理で取得（同時実行数を制限）
+        executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+        futures = [executor.submit(fetch, i) for i in range(len(batches))]
+        try:
+            # 元の順序で待つため、先に終わった後続のバッチは順番が来るまで保持される
+            for future in futures:
+                vtubers = future.result()
+                if vtubers:
+                    yield vtubers
+        finally:
+            # 途中で打ち切られた場合は未着手のバッチを取り消す
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def get_vtuber_details_batch(
+        self,
+        names: List[str],
+        batch_size: int = 10,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+        max_retries: int = 2,
+        retry_backoff: float = 1.0,
+        on_batch_done: Optional[Callable[[int, int], None]] = None,
+    ) -> List[Dict]:
+        """複数のライバーの詳細情報を取得（取得できたバッチの結果を元の順序で結合）"""
+        all_vtubers = []
+        for vtubers in self.iter_vtuber_details(
+            names,
+            batch_size=batch_size,
+            max_concurrency=max_concurrency,
+            requests_per_second=requests_per_second,
+            max_retries=max_retries,
+            retry_backoff=retry_backoff,
+            on_batch_done=on_batch_done,
+        ):
+            all_vtubers.extend(vtubers)
         return all_vtubers
 
-    def enhance_vtuber_data(self, vtuber_data: Dict) -> Dict:
-        """ライバーデータを推薦システム用に補完"""
-        enhanced = vtuber_data.copy()
-
-        # 欠損データの補完
-        if "gender" not in enhanced or not enhanced["gender"]:
-            # 名前から性別を推定（簡易版）
-            name = enhanced.get("name", "")
-            if any(
-                char in name
-                for char in ["美", "華", "花", "姫", "音", "愛", "香", "桜", "月", "星"]
-            ):
-                enhanced["gender"] = "女性"
-            else:
-                enhanced["gender"] = "男性"  # デフォルト
-
-        # 声質の推定
-        if "voice_type" not in enhanced or not enhanced["voice_type"]:
-            if enhanced["gender"] == "女性":
-                enhanced["voice_type"] = "高音"
-            else:
-                enhanced["voice_type"] = "低音"
-
-        # 配信時間の推定
-        if "main_streaming_time" not in enhanced or not enhanced["main_streaming_time"]:
-            enhanced["main_streaming_time"] = "夜"  # デフォルト
-
-        # 数値データの補完
-        if "subscriber_count" not in enhanced or not enhanced["subscriber_count"]:
-            enhanced["subscriber_count"] = 500000  # デフォルト値
-
-        if "average_viewers" not in enhanced or not enhanced["average_viewers"]:
-            # 登録者数の5-10%を視聴者数とする
-            enhanced["average_viewers"] = int(enhanced["subscriber_count"] * 0.07)
-
-        # スキル値の推定
-        enhanced["streaming_frequency"] = 4  # 週4回
-        enhanced["collab_frequency"] = 3  # 月3回
-
-        # 配信ジャンルに基づいてスキルを推定
-        streaming_genres = enhanced.get("streaming_genres", [])
-        enhanced["singing_skill"] = 8 if "歌" in streaming_genres else 5
-        enhanced["gaming_skill"] = 8 if "ゲーム" in streaming_genres else 5
-        enhanced["talk_skill"] = 9 if "雑談" in streaming_genres else 6
-
-        # アバターカラーテーマの推定
-        if "avatar_color_theme" not in enhanced or not enhanced["avatar_color_theme"]:
-            color_themes = [
-                "白・青",
-                "緑・茶",
-                "黒・青",
-                "紫・白",
-                "ピンク・白",
-                "青・白",
-                "白・水色",
-                "オレンジ・白",
-                "赤・黒",
-                "灰・黒",
-            ]
-            enhanced["avatar_color_theme"] = color_themes[
-                hash(enhanced["name"]) % len(color_themes)
-            ]
-
-        # デビュー日の補完
-        if "debut_date" not in enhanced or not enhanced["debut_date"]:
-            enhanced["debut_date"] = "2018-01-01"  # デフォルト
-
-        return enhanced
-
-
-def load_mcp_vtuber_data():
-    """MCPサーバーからライバーデータを取得して推薦システム用に変換"""
-    loader = MCPDataLoader()
-
-    print("ライバー一覧を取得中...")
-    vtuber_names = loader.get_vtuber_list()
-    print(f"取得したライバー数: {len(vtuber_names)}")
-
-    if not vtuber_names:
-        print("ライバー一覧の取得に失敗しました")
+
+def _report_fetch_progress(progress: Optional[Callable[[str, float], None]]):
+    """詳細取得の進捗をジョブの進捗（10%〜80%）に変換するコールバックを作成"""
+    if progress is None:
+        return None
+
+    def on_batch_done(done: int, total: int):
+        progress(f"詳細情報を取得中（{done}/{total}バッチ）", 0.1 + 0.7 * done / total)
+
+    return on_batch_done
+
+
+def _enhance_chunk(vtubers: List[Dict]):
+    """取得した生データのチャンクを補完し、内容ハッシュの列を付ける"""
+    with stage_timer("enhance"):
+        enhanced = enhance_vtubers(vtubers)
+        enhanced["content_hash"] = [vtuber_content_hash(v) for v in vtubers]
+    return enhanced
+
+
+def stream_mcp_vtuber_data(
+    server_command: Optional[List[str]] = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_chunk_size: int = MAX_CHUNK_SIZE,
+    progress: Optional[Callable[[str, float], None]] = None,
+) -> Iterator[Any]:
+    """MCPサーバーからライバーデータを取得し、補完済みの DataFrame をチャンクごとに返す
+
+    詳細情報のバッチが届くたびに補完するため、呼び出し側は後続のバッチの取得中に
+    エンコードなどを進められる。補完前の生データはチャンクを返した時点で破棄する。
+    チャンクは chunk_size 名から始めて max_chunk_size 名まで倍々に大きくする
+    （最初のチャンクを早く返しつつ、チャンクごとの処理のオーバーヘッドを抑える）。
+    チャンクの順序はライバー一覧の順で、実行ごとに変わらない。
+    """
+    started = time.perf_counter()
+    # 取得処理全体で1つのMCPサーバープロセスを使い回す
+    with MCPDataLoader(server_command=server_command) as loader:
+        if progress is not None:
+            progress("ライバー一覧を取得中", 0.05)
+        print("ライバー一覧を取得中...")
+        vtuber_names = loader.get_vtuber_list()
+        print(f"取得したライバー数: {len(vtuber_names)}")
+
+        if not vtuber_names:
+            print("ライバー一覧の取得に失敗しました")
+            return
+
+        print("ライバー詳細情報を取得中...")
+        pending: List[Dict] = []
+        total = [0]
+        target = [max(1, chunk_size)]
+
+        def emit(chunk):
+            enhanced = _enhance_chunk(chunk)
+            if total[0] == 0:
+                # 最初のチャンクが使えるようになるまでの時間
+                STAGE_DURATION.observe(time.perf_counter() - started, stage="first_chunk")
+            total[0] += len(chunk)
+            target[0] = min(target[0] * 2, max(max_chunk_size, chunk_size))
+            return enhanced
+
+        for vtubers in loader.iter_vtuber_details(
+            vtuber_names,
+            batch_size=5,
+            max_concurrency=max_concurrency,
+            requests_per_second=requests_per_second,
+            on_batch_done=_report_fetch_progress(progress),
+        ):
+            pending.extend(vtuber for vtuber in vtubers if vtuber)  # Noneを除外
+            while len(pending) >= target[0]:
+                chunk, pending = pending[: target[0]], pending[target[0] :]
+                yield emit(chunk)
+        if pending:
+            yield emit(pending)
+
+    print(f"最終的なライバー数: {total[0]}")
+
+
+def load_mcp_vtuber_data(
+    server_command: Optional[List[str]] = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    progress: Optional[Callable[[str, float], None]] = None,
+):
+    """MCPサーバーからライバーデータを取得して推薦システム用に変換
+
+    戻り値は1行1名の DataFrame（取得できなかった場合は空）。
+    progress を渡すと (処理段階, 進捗率0〜1) で進捗が報告される。
+    """
+    chunks = list(
+        stream_mcp_vtuber_data(
+            server_command=server_command,
+            max_concurrency=max_concurrency,
+            requests_per_second=requests_per_second,
+            progress=progress,
+        )
+    )
+    if not chunks:
+        return enhance_vtubers([])
+    return pd.concat(chunks, ignore_index=True)
+
+
+def rotating_recheck_names(names: List[str], fraction: float, round_number: int) -> List[str]:
+    """既存ライバーのうち、この回に再確認する名前を返す
+
+    名前の安定したダイジェストで ceil(1 / fraction) 個の組に分け、round_number
+    番目の組を返す。round_number を1ずつ進めると、全員がその回数ごとに1回ずつ
+    再確認される（一覧の並びが変わっても組は変わらない）。
+    """
+    if not fraction > 0 or not names:
         return []
+    if fraction >= 1:
+        return list(names)
+    n_groups = math.ceil(1 / fraction)
+    groups = stable_digests(names) % np.uint64(n_groups)
+    return [name for name, group in zip(names, groups) if group == round_number % n_groups]
+
+
+def fetch_mcp_vtuber_updates(
+    known_hashes: Dict[str, str],
+    server_command: Optional[List[str]] = None,
+    recheck_existing: bool = False,
+    recheck_fraction: float = DEFAULT_RECHECK_FRACTION,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    progress: Optional[Callable[[str, float], None]] = None,
+):
+    """現在のロスターとの差分をMCPサーバーから取得
+
+    known_hashes は現在のロスターの「ライバー名 -> 内容ハッシュ」。詳細情報は
+    新しく一覧に現れたライバーと、既存のライバーのうち recheck_fraction の割合の
+    分だけ取得し、内容ハッシュが変わったものだけを差分とする。再確認する既存の
+    ライバーは呼び出しごとに入れ替わるため、内容の変更も 1 / recheck_fraction 回
+    以内の差分更新で反映される（recheck_existing=True なら既存の全員を取得する）。
+
+    戻り値は (追加・変更されたライバーの DataFrame, 一覧から消えたライバー名のリスト)。
+    一覧の取得に失敗した場合は None を返す。
+    """
+    with MCPDataLoader(server_command=server_command) as loader:
+        if progress is not None:
+            progress("ライバー一覧を取得中", 0.05)
+        print("ライバー一覧を取得中...")
+        vtuber_names = loader.get_vtuber_list()
+        print(f"取得したライバー数: {len(vtuber_names)}")
+
+        if not vtuber_names:
+            print("ライバー一覧の取得に失敗しました")
+            return None
 
-    print("ライバー詳細情報を取得中...")
-    vtuber_details = loader.get_vtuber_details_batch(vtuber_names, batch_size=5)
-    print(f"詳細情報を取得したライバー数: {len(vtuber_details)}")
+        listed = set(vtuber_names)
+        removed_names = [name for name in known_hashes if name not in listed]
+        existing = [name for name in vtuber_names if name in known_hashes]
+        recheck = set(
+            existing
+            if recheck_existing
+            else rotating_recheck_names(existing, recheck_fraction, next(_recheck_rounds))
+        )
+        targets = [
+            name for name in vtuber_names if name in recheck or name not in known_hashes
+        ]
+        print(
+            f"新規: {len(vtuber_names) - len(existing)}名, "
+            f"削除: {len(removed_names)}名, 再確認: {len(recheck)}名, "
+            f"詳細取得対象: {len(targets)}名"
+        )
+
+        # 内容が変わっていないライバーはバッチが届いた時点で捨てる
+        changed = []
+        if targets:
+            for vtubers in loader.iter_vtuber_details(
+                targets,
+                batch_size=5,
+                max_concurrency=max_concurrency,
+                requests_per_second=requests_per_second,
+                on_batch_done=_report_fetch_progress(progress),
+            ):
+                for vtuber in vtubers:
+                    if not vtuber:
+                        continue
+                    content_hash = vtuber_content_hash(vtuber)
+                    if known_hashes.get(vtuber.get("name")) != content_hash:
+                        changed.append(vtuber)
 
-    # データを推薦システム用に変換・補完
-    enhanced_vtubers = []
-    for vtuber in vtuber_details:
-        if vtuber:  # Noneでない場合のみ処理
-            enhanced = loader.enhance_vtuber_data(vtuber)
-            enhanced_vtubers.append(enhanced)
+    updated_vtubers = _enhance_chunk(changed)
 
-    print(f"最終的なライバー数: {len(enhanced_vtubers)}")
-    return enhanced_vtubers
+    print(f"追加・変更されたライバー数: {len(updated_vtubers)}")
+    return updated_vtubers, removed_names
 
 
 if __name__ == "__main__":
@@ -251,9 +469,9 @@ if __name__ == "__main__":
     vtubers = load_mcp_vtuber_data()
     print(f"\n取得完了: {len(vtubers)}名のライバー")
 
-    if vtubers:
+    if len(vtubers) > 0:
         print("\n最初の3名のサンプル:")
-        for i, vtuber in enumerate(vtubers[:3]):
+        for i, vtuber in enumerate(vtubers.head(3).to_dict("records")):
             print(f"{i + 1}. {vtuber['name']}")
             print(f"   性別: {vtuber.get('gender', '不明')}")
             print(f"   配信ジャンル: {vtuber.get('streaming_genres', [])}")
@@ -0,0 +1,250 @@
+import itertools
+import json
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional
+
+
+PROTOCOL_VERSION = "2024-11-05"
+CLIENT_INFO = {"name": "recommend-vtuber", "version": "1.0.0"}
+
+
+class MCPSessionError(Exception):
+    """MCPサーバーとの通信に失敗した"""
+
+
+class MCPTimeoutError(MCPSessionError):
+    """MCPサーバーからの応答がタイムアウトした"""
+
+
+class _ServerProcess:
+    """起動中のMCPサーバープロセス1つ分の状態"""
+
+    def __init__(self, command: List[str], cwd: Optional[str] = None):
+        try:
+            self.process = subprocess.Popen(
+                command,
+                cwd=cwd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding="utf-8",
+                bufsize=1,
+            )
+        except OSError as e:
+            raise MCPSessionError(f"MCPサーバーを起動できませんでした: {e}") from e
+
+        # JSON-RPCのid -> 応答待ちのFuture
+        self.pending: Dict[int, Future] = {}
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.stderr_tail = deque(maxlen=20)
+        self.closed = False
+
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+        threading.Thread(target=self._read_stderr, daemon=True).start()
+
+    def alive(self) -> bool:
+        return not self.closed and self.process.poll() is None
+
+    def send(self, message: Dict[str, Any], future: Optional[Future] = None):
+        """メッセージを1行のJSONとして送信（futureを渡すと応答待ちに登録）"""
+        with self.lock:
+            if self.closed:
+                raise MCPSessionError("MCPサーバーが停止しています")
+            if future is not None:
+                self.pending[message["id"]] = future
+
+        try:
+            with self.write_lock:
+                self.process.stdin.write(json.dumps(message, ensure_ascii=False) + "\n")
+                self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            self.discard(message.get("id"))
+            raise MCPSessionError(f"MCPサーバーへの送信に失敗しました: {e}") from e
+
+    def discard(self, request_id):
+        with self.lock:
+            self.pending.pop(request_id, None)
+
+    def _read_stdout(self):
+        for line in self.process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            # サーバーからの通知やリクエストは扱わない
+            if not isinstance(message, dict) or "method" in message:
+                continue
+
+            with self.lock:
+                future = self.pending.pop(message.get("id"), None)
+            if future is not None:
+                future.set_result(message)
+
+        # 標準出力が閉じた = プロセス終了。応答待ちをすべて失敗させる
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        message = "MCPサーバーが終了しました"
+        detail = "".join(self.stderr_tail).strip()
+        if detail:
+            message = f"{message}: {detail}"
+        for future in pending.values():
+            future.set_exception(MCPSessionError(message))
+
+    def _read_stderr(self):
+        for line in self.process.stderr:
+            self.stderr_tail.append(line)
+
+    def close(self, timeout: float = 5):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class MCPSession:
+    """stdioパイプを開いたままMCPサーバーと通信する常駐セッション
+
+    初期化ハンドシェイクは起動時に1度だけ行い、リクエストはJSON-RPCのidで
+    多重化するため複数スレッドから同時に呼び出せる。サーバーが異常終了した
+    場合は次の呼び出し時に再起動する。
+    """
+
+    def __init__(
+        self,
+        command: List[str],
+        timeout: float = 30,
+        max_restarts: int = 3,
+        cwd: Optional[str] = None,
+    ):
+        self.command = list(command)
+        self.cwd = cwd
+        self.timeout = timeout
+        self.max_restarts = max_restarts
+        self.restart_count = 0
+        self.server_info: Optional[Dict] = None
+
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server: Optional[_ServerProcess] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        """サーバーを起動してハンドシェイクを行う"""
+        with self._lock:
+            self._ensure_server()
+
+    def close(self):
+        """サーバーを終了する"""
+        with self._lock:
+            if self._server is not None:
+                self._server.close()
+                self._server = None
+
+    def _ensure_server(self) -> _ServerProcess:
+        """稼働中のサーバーを返す（異常終了していれば再起動）"""
+        if self._server is not None and self._server.alive():
+            return self._server
+
+        if self._server is not None:
+            if self.restart_count >= self.max_restarts:
+                raise MCPSessionError("MCPサーバーの再起動回数が上限に達しました")
+            self.restart_count += 1
+            print(f"MCPサーバーを再起動します（{self.restart_count}回目）")
+            self._server.close(timeout=1)
+            self._server = None
+
+        server = _ServerProcess(self.command, cwd=self.cwd)
+        try:
+            result = self._roundtrip(
+                server,
+                "initialize",
+                {
+                    "protocolVersion": PROTOCOL_VERSION,
+                    "capabilities": {},
+                    "clientInfo": CLIENT_INFO,
+                },
+                self.timeout,
+            )
+            self.server_info = result.get("serverInfo")
+            server.send({"jsonrpc": "2.0", "method": "notifications/initialized"})
+        except Exception:
+            server.close(timeout=1)
+            raise
+
+        self._server = server
+        return server
+
+    def _roundtrip(
+        self, server: _ServerProcess, method: str, params: Dict, timeout: float
+    ) -> Dict:
+        request_id = next(self._ids)
+        future = Future()
+        server.send(
+            {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params},
+            future,
+        )
+
+        try:
+            message = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            server.discard(request_id)
+            raise MCPTimeoutError(f"MCPリクエスト {method} がタイムアウトしました")
+
+        if "error" in message:
+            error = message["error"] or {}
+            raise MCPSessionError(f"MCP error: {error.get('message', error)}")
+        return message.get("result") or {}
+
+    def request(
+        self, method: str, params: Optional[Dict] = None, timeout: float = None
+    ) -> Dict:
+        """JSON-RPCリクエストを送信して結果を返す"""
+        if timeout is None:
+            timeout = self.timeout
+
+        while True:
+            with self._lock:
+                server = self._ensure_server()
+            try:
+                return self._roundtrip(server, method, params or {}, timeout)
+            except MCPTimeoutError:
+                raise
+            except MCPSessionError:
+                # 通信中にサーバーが落ちた場合は再起動してやり直す
+                if server.alive():
+                    raise
+
+    def call_tool(self, tool_name: str, arguments: Dict[str, Any] = None) -> Optional[Dict]:
+        """MCPツールを呼び出し、テキスト応答をJSONとして返す"""
+        result = self.request(
+            "tools/call", {"name": tool_name, "arguments": arguments or {}}
+        )
+        content = result.get("content", [])
+        if not content:
+            return None
+        try:
+            return json.loads(content[0]["text"])
+        except (json.JSONDecodeError, KeyError, TypeError):
+            return None
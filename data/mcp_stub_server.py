@@ -0,0 +1,200 @@
+"""MCPサーバーのスタブ（オフライン開発・動作確認用）
+
+mcp-server/build/index.js と同じツール（get_vtuber_list / get_vtuber_details /
+get_multiple_vtuber_details）を、サンプルデータを使って stdio の JSON-RPC で提供する。
+
+    python -m data.mcp_stub_server [--delay 秒] [--crash-after 回数] [--synthetic 人数]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from data.vtuber_data import create_sample_vtuber_data
+
+
+# wikiから取得できる項目（数値スキルなどはMCPDataLoader側で補完される）
+WIKI_FIELDS = [
+    "name",
+    "debut_date",
+    "gender",
+    "voice_type",
+    "personality_traits",
+    "streaming_genres",
+    "game_genres",
+    "main_streaming_time",
+    "subscriber_count",
+    "avatar_color_theme",
+]
+
+
+def load_stub_vtubers(synthetic=None):
+    """スタブが返すライバー情報を作成（synthetic を指定すると合成データの人数分）"""
+    if synthetic:
+        from data.synthetic_data import create_synthetic_vtuber_data
+
+        records = create_synthetic_vtuber_data(synthetic).to_dict("records")
+    else:
+        records = create_sample_vtuber_data().to_dict("records")
+    return {
+        record["name"]: {field: record[field] for field in WIKI_FIELDS}
+        for record in records
+    }
+
+
+class StubServer:
+    """サンプルデータを返すMCPサーバー"""
+
+    def __init__(self, delay=0.0, crash_after=None, synthetic=None):
+        self.vtubers = load_stub_vtubers(synthetic)
+        self.delay = delay
+        self.crash_after = crash_after
+        self.tool_calls = 0
+        self.write_lock = threading.Lock()
+        self.count_lock = threading.Lock()
+        self.workers = []
+
+    def write(self, message):
+        with self.write_lock:
+            sys.stdout.write(json.dumps(message, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+
+    def text_result(self, request_id, payload, is_error=False):
+        text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+        result = {"content": [{"type": "text", "text": text}]}
+        if is_error:
+            result["isError"] = True
+        self.write({"jsonrpc": "2.0", "id": request_id, "result": result})
+
+    def call_tool(self, request_id, name, arguments):
+        with self.count_lock:
+            self.tool_calls += 1
+            calls = self.tool_calls
+        if self.crash_after is not None and calls > self.crash_after:
+            # 異常終了を再現する
+            sys.stderr.write("stub server crashed\n")
+            sys.stderr.flush()
+            os._exit(1)
+
+        if self.delay:
+            time.sleep(self.delay)
+
+        if name == "get_vtuber_list":
+            names = list(self.vtubers)
+            self.text_result(request_id, {"count": len(names), "vtubers": names})
+        elif name == "get_vtuber_details":
+            details = self.vtubers.get(str(arguments.get("name")))
+            if details is None:
+                self.text_result(
+                    request_id,
+                    f"ライバー「{arguments.get('name')}」の情報が見つかりませんでした。",
+                    is_error=True,
+                )
+            else:
+                self.text_result(request_id, details)
+        elif name == "get_multiple_vtuber_details":
+            limit = min(int(arguments.get("limit") or 20), 50)
+            names = list(arguments.get("names") or [])[:limit]
+            results = [self.vtubers[n] for n in names if n in self.vtubers]
+            self.text_result(
+                request_id,
+                {"processed": len(names), "successful": len(results), "vtubers": results},
+            )
+        else:
+            self.write(
+                {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "error": {"code": -32601, "message": f"未知のツール: {name}"},
+                }
+            )
+
+    def handle(self, message):
+        method = message.get("method")
+        request_id = message.get("id")
+        if request_id is None:
+            return  # 通知には応答しない
+
+        if method == "initialize":
+            self.write(
+                {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": {
+                        "protocolVersion": message.get("params", {}).get(
+                            "protocolVersion", "2024-11-05"
+                        ),
+                        "capabilities": {"tools": {}, "resources": {}},
+                        "serverInfo": {"name": "nijisanji-wiki-stub", "version": "0.1.0"},
+                    },
+                }
+            )
+        elif method == "tools/call":
+            params = message.get("params", {})
+            # 実サーバーと同様に、ツール呼び出しは並行に処理する
+            worker = threading.Thread(
+                target=self.call_tool,
+                args=(request_id, params.get("name"), params.get("arguments") or {}),
+                daemon=True,
+            )
+            worker.start()
+            self.workers.append(worker)
+        else:
+            self.write(
+                {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "error": {"code": -32601, "message": f"Method not found: {method}"},
+                }
+            )
+
+    def serve(self):
+        for stream in (sys.stdin, sys.stdout, sys.stderr):
+            stream.reconfigure(encoding="utf-8")
+        sys.stderr.write("にじさんじwiki MCPスタブサーバーが起動しました\n")
+        sys.stderr.flush()
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self.handle(message)
+
+        # 標準入力が閉じても処理中の応答は返し切る
+        for worker in self.workers:
+            worker.join()
+
+
+def stub_server_command(delay=0.0, crash_after=None, synthetic=None):
+    """スタブを起動するコマンド（プロジェクトルートをcwdにして実行する）"""
+    command = [sys.executable, "-m", "data.mcp_stub_server", "--delay", str(delay)]
+    if crash_after is not None:
+        command += ["--crash-after", str(crash_after)]
+    if synthetic:
+        command += ["--synthetic", str(synthetic)]
+    return command
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCPサーバーのスタブ")
+    parser.add_argument("--delay", type=float, default=0.0, help="ツール応答の遅延（秒）")
+    parser.add_argument(
+        "--crash-after", type=int, default=None, help="指定回数のツール呼び出し後に異常終了"
+    )
+    parser.add_argument(
+        "--synthetic", type=int, default=None, help="サンプルデータの代わりに返す合成データの人数"
+    )
+    args = parser.parse_args()
+    StubServer(
+        delay=args.delay, crash_after=args.crash_after, synthetic=args.synthetic
+    ).serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# 事前にシリアライズ・圧縮しておくHTTPレスポンス
+import gzip
+import hashlib
+import json
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli は任意の依存関係
+    brotli = None
+
+
+class PreparedResponse:
+    """JSONレスポンスの本文を一度だけシリアライズ・圧縮して保持するクラス
+
+    本文の内容から強いETagを作成し、圧縮形式ごとに別のETagを付ける。
+    """
+
+    def __init__(self, data, mimetype="application/json"):
+        self.mimetype = mimetype
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode(
+            "utf-8"
+        )
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+
+        # Content-Encoding -> 圧縮済みの本文
+        self.encoded = {"identity": self.body}
+        self.encoded["gzip"] = gzip.compress(self.body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(self.body)
+
+        # Content-Encoding -> ETag
+        self.etags = {
+            encoding: digest if encoding == "identity" else f"{digest}-{encoding}"
+            for encoding in self.encoded
+        }
+
+    def negotiate(self, accept_encodings):
+        """Accept-Encoding に基づいて返す圧縮形式を選ぶ
+
+        accept_encodings は werkzeug の Accept オブジェクト（品質値を返す）。
+        同じ品質値なら圧縮率の高い形式を優先する。
+        """
+        best, best_quality = "identity", 0.0
+        for encoding in ("br", "gzip"):
+            if encoding not in self.encoded:
+                continue
+            quality = accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def matches(self, if_none_match):
+        """If-None-Match がいずれかの表現のETagと一致するか"""
+        return any(if_none_match.contains_weak(etag) for etag in self.etags.values())
+
+
+class FilePreparedResponse(PreparedResponse):
+    """ファイルに書き出した本文を参照する PreparedResponse（複数プロセスで共有する場合）
+
+    本文はプロセスのメモリに読み込まず、送信時にファイルから送る。
+    encoded は Content-Encoding -> ファイルのパス、sizes はそのバイト数。
+    keep_alive には、このオブジェクトが使われている間ファイルを消させないための
+    オブジェクト（共有データセットの世代のロック）を渡す。
+    """
+
+    def __init__(self, paths, etags, mimetype="application/json", keep_alive=None):
+        self.keep_alive = keep_alive
+        self.mimetype = mimetype
+        self.encoded = dict(paths)
+        self.sizes = {encoding: os.path.getsize(path) for encoding, path in paths.items()}
+        self.etags = dict(etags)
+
+    def open(self, encoding):
+        return open(self.encoded[encoding], "rb")
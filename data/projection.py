@@ -0,0 +1,184 @@
+# ライバーの特徴量を2次元・3次元に射影した地図（PCA）と、表示用の間引き
+import base64
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 射影する次元数（2次元の地図は先頭の2軸を使う）
+PROJECTION_DIMS = 3
+
+# 1回の応答に含める点の数（既定値と上限）
+DEFAULT_MAP_POINTS = 2000
+MAX_MAP_POINTS = 10000
+
+# 表示範囲を指定しない応答をキャッシュする数
+PAYLOAD_CACHE_SIZE = 16
+
+
+def pca_projection(matrix, n_components=PROJECTION_DIMS):
+    """特徴量行列（疎行列または密行列）を主成分に射影する
+
+    共分散行列（特徴量数 × 特徴量数）の固有値分解で主成分を求めるため、
+    疎行列を密にせずに済む。主成分の符号は負荷量の絶対値が最大の要素が
+    正になるように揃える（同じデータなら常に同じ向きになる）。
+    戻り値は (座標 float32 の 行 × n_components, 各主成分の寄与率)。
+    """
+    n_rows, n_features = matrix.shape
+    mean = np.asarray(matrix.mean(axis=0), dtype=np.float64).ravel()
+    gram = matrix.T @ matrix
+    gram = gram.toarray() if hasattr(gram, "toarray") else np.asarray(gram)
+    covariance = (gram - n_rows * np.outer(mean, mean)) / max(n_rows - 1, 1)
+
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    eigenvalues = np.clip(eigenvalues, 0.0, None)
+    order = np.argsort(eigenvalues, kind="stable")[::-1][:n_components]
+    components = eigenvectors[:, order]
+    largest = np.abs(components).argmax(axis=0)
+    signs = np.sign(components[largest, np.arange(components.shape[1])])
+    components *= np.where(signs == 0, 1.0, signs)
+
+    coords = np.zeros((n_rows, n_components), dtype=np.float32)
+    coords[:, : len(order)] = np.asarray(matrix @ components) - mean @ components
+    total = eigenvalues.sum()
+    explained = np.zeros(n_components)
+    explained[: len(order)] = eigenvalues[order] / total if total > 0 else 0.0
+    return coords, explained
+
+
+def _encode(array):
+    """配列をリトルエンディアンのバイト列の base64 文字列にする"""
+    data = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+    return base64.b64encode(data.tobytes()).decode("ascii")
+
+
+class MapProjection:
+    """データセットごとに一度だけ計算するライバーの地図（PCAの座標）
+
+    座標は float32、クラスタ番号は int16 で保持する。x 座標順の行番号も
+    持つため、表示範囲での絞り込みは二分探索で済む。x_order・sorted_x は
+    共有データセットで書き出したものを渡す場合だけ指定する（省略時は計算する）。
+    """
+
+    def __init__(self, coords, clusters, explained_variance_ratio, x_order=None, sorted_x=None):
+        self.coords = np.asarray(coords, dtype=np.float32)
+        self.clusters = np.asarray(clusters, dtype=np.int16)
+        self.explained_variance_ratio = [float(v) for v in explained_variance_ratio]
+        if x_order is None:
+            x_order = np.argsort(self.coords[:, 0], kind="stable")
+            sorted_x = np.ascontiguousarray(self.coords[x_order, 0])
+        self.x_order = x_order
+        self.sorted_x = sorted_x
+        if len(self.coords):
+            self.bounds = np.stack([self.coords.min(axis=0), self.coords.max(axis=0)], 1)
+        else:
+            self.bounds = np.zeros((self.coords.shape[1], 2), dtype=np.float32)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_features(cls, matrix, clusters=None):
+        """標準化済み特徴量行列から地図を作成（clusters がなければクラスタ番号は -1）"""
+        coords, explained = pca_projection(matrix)
+        if clusters is None:
+            clusters = np.full(len(coords), -1)
+        return cls(coords, clusters, explained)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def select(self, dims=2, max_points=DEFAULT_MAP_POINTS, viewport=None):
+        """表示する点の行番号（昇順）と、各点が代表するライバー数を返す
+
+        viewport=(x_min, x_max, y_min, y_max) を指定するとその範囲の点だけにする。
+        点が max_points を超える場合は、範囲を格子に分けて格子ごとに1点
+        （行番号が最も小さいライバー）だけを残す。
+        """
+        if viewport is None:
+            rows = np.arange(len(self.coords))
+            points = self.coords[:, :dims]
+            low, high = self.bounds[:dims, 0], self.bounds[:dims, 1]
+        else:
+            x_min, x_max, y_min, y_max = viewport
+            start = np.searchsorted(self.sorted_x, x_min, side="left")
+            end = np.searchsorted(self.sorted_x, x_max, side="right")
+            rows = self.x_order[start:end]
+            y = self.coords[rows, 1]
+            rows = np.sort(rows[(y >= y_min) & (y <= y_max)])
+            points = self.coords[rows, :dims]
+            low = np.r_[x_min, y_min, self.bounds[2:dims, 0]]
+            high = np.r_[x_max, y_max, self.bounds[2:dims, 1]]
+
+        if len(rows) <= max_points:
+            return rows, np.ones(len(rows), dtype=np.uint32)
+
+        # 各軸を cells 等分した格子（格子の数は max_points 以下）
+        cells = max(1, int(np.floor(max_points ** (1 / dims) + 1e-9)))
+        span = np.where(high > low, high - low, 1.0)
+        position = np.clip(((points - low) / span * cells).astype(np.int64), 0, cells - 1)
+        cell_ids = np.ravel_multi_index(position.T, (cells,) * dims)
+        counts = np.bincount(cell_ids, minlength=cells**dims)
+        # 格子ごとに rows の中で最初の位置（rows は昇順なので行番号が最小の点）
+        first = np.full(len(counts), len(rows))
+        np.minimum.at(first, cell_ids, np.arange(len(rows)))
+        occupied = np.flatnonzero(counts)
+        order = np.argsort(first[occupied])
+        return rows[first[occupied][order]], counts[occupied][order].astype(np.uint32)
+
+    def payload(self, dims=2, max_points=DEFAULT_MAP_POINTS, viewport=None, include=()):
+        """/api/map の応答本文（配列は base64 のリトルエンディアン）
+
+        coords は float32 の 点 × dims、clusters は int16、rows は /api/vtubers の
+        並びでの行番号（uint32）、weights は各点が代表するライバー数（uint32）。
+        include に指定した行は間引きや表示範囲によらず "include" に入れる。
+        """
+        key = (dims, max_points)
+        cacheable = viewport is None and not include
+        if cacheable:
+            with self._lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    return self._cache[key]
+
+        rows, weights = self.select(dims, max_points, viewport)
+        included = np.asarray(sorted(set(include)), dtype=np.int64)
+        payload = {
+            "dims": dims,
+            "total": len(self.coords),
+            "count": len(rows),
+            "downsampled": bool(weights.sum() > len(rows)),
+            "bounds": self.bounds[:dims].ravel().tolist(),
+            "explained_variance_ratio": self.explained_variance_ratio[:dims],
+            "coords": _encode(self.coords[rows, :dims]),
+            "clusters": _encode(self.clusters[rows]),
+            "rows": _encode(rows.astype(np.uint32)),
+            "weights": _encode(weights),
+            "include": {
+                "count": len(included),
+                "coords": _encode(self.coords[included, :dims]),
+                "clusters": _encode(self.clusters[included]),
+                "rows": _encode(included.astype(np.uint32)),
+            },
+        }
+
+        if cacheable:
+            with self._lock:
+                self._cache[key] = payload
+                while len(self._cache) > PAYLOAD_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return payload
+
+
+if __name__ == "__main__":
+    # テスト実行
+    from data.synthetic_data import create_synthetic_vtuber_data
+    from data.vtuber_data import encode_categorical_features, perform_clustering
+
+    df, _, scaler, _ = perform_clustering(
+        encode_categorical_features(create_synthetic_vtuber_data(20000, seed=42)), n_clusters=8
+    )
+    projection = MapProjection.from_features(scaler.matrix_, df["cluster"].to_numpy())
+    print(f"寄与率: {[round(v, 3) for v in projection.explained_variance_ratio]}")
+    for dims in (2, 3):
+        rows, weights = projection.select(dims, max_points=500)
+        print(f"{dims}次元: {len(projection)}名 -> {len(rows)}点（最大{weights.max()}名を代表）")
@@ -0,0 +1,295 @@
+# 推薦スコアリングエンジン
+import os
+from collections.abc import Hashable
+
+import numpy as np
+
+from data.roster_store import RosterStore
+from data.vtuber_data import build_roster_index
+
+
+# 嗜好ごとの重み（app.calculate_recommendations の従来ロジックと同じ）
+SCORE_WEIGHTS = {
+    "streaming_genre": 3,
+    "game_genre": 2,
+    "streaming_time": 5,
+    "gender": 2,
+    "voice_type": 3,
+    "personality": 2,
+}
+
+# 複数選択の嗜好: (嗜好キー, リスト列, ワンホット列の接頭辞)
+MULTI_LABEL_FIELDS = [
+    ("streaming_genre", "streaming_genres", "streaming_"),
+    ("game_genre", "game_genres", "game_"),
+    ("personality", "personality_traits", "personality_"),
+]
+
+# 単一選択の嗜好: (嗜好キー, カテゴリ列)
+CATEGORICAL_FIELDS = [
+    ("streaming_time", "main_streaming_time"),
+    ("gender", "gender"),
+    ("voice_type", "voice_type"),
+]
+
+# 一括推薦で一度に作成するスコア行列の最大要素数（float32 で約64MB）
+BATCH_SCORE_ELEMENTS = 16_000_000
+
+# クラスタで絞り込む探索で採点するクラスタ数の既定値（未設定なら全件を採点する）
+DEFAULT_NPROBE = (
+    int(os.environ["VTUBER_RECOMMEND_NPROBE"])
+    if os.environ.get("VTUBER_RECOMMEND_NPROBE")
+    else None
+)
+
+
+def top_k_indices(scores, k):
+    """スコア上位k件の行番号を返す（同点は行番号の昇順）"""
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        return np.argsort(-scores, kind="stable")
+
+    # 部分選択でk番目のスコアを求め、それより大きい行と同点の先頭行だけを候補にする
+    threshold = np.partition(scores, n - k)[n - k]
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)[: k - len(above)]
+    candidates = np.concatenate([above, ties])
+
+    # 候補のみをスコア降順・行番号昇順で並べる
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+
+def top_k_rows(rows, scores, k):
+    """行番号 rows とそのスコアから上位k件の行番号を返す（同点は行番号の昇順）
+
+    rows は昇順でなくてもよい（top_k_indices の行番号を指定できる版）。
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=rows.dtype)
+    if k < n:
+        # k番目のスコアより大きい行と、同点の行のうち行番号の小さいものだけを候補にする
+        threshold = np.partition(scores, n - k)[n - k]
+        above = np.flatnonzero(scores > threshold)
+        ties = rows[scores == threshold]
+        needed = k - len(above)
+        if needed < len(ties):
+            ties = np.partition(ties, needed - 1)[:needed]
+        rows = np.concatenate([rows[above], ties])
+        scores = np.concatenate([scores[above], np.full(len(ties), threshold)])
+    return rows[np.lexsort((rows, -scores))]
+
+
+class RecommendationEngine:
+    """ロード時に指示行列を構築し、推薦スコアを行列ベクトル積で計算するクラス"""
+
+    def __init__(self, df, index=None, roster=None):
+        self.df = df
+        self.n_rows = len(df)
+
+        # 嗜好値 -> 該当行番号の転置インデックス
+        self.index = index if index is not None else build_roster_index(df)
+
+        # レスポンス用の行データは辞書エンコードしたストアから必要な行だけ復元する
+        self.roster = roster if roster is not None else RosterStore.from_frame(df)
+
+        # (嗜好キー, 値) -> 指示行列の列番号
+        self.columns = {}
+        blocks = []
+
+        for key, list_column, _ in MULTI_LABEL_FIELDS:
+            vocabulary, block = self.roster.indicator(list_column)
+            self._add_block(blocks, key, vocabulary, block)
+
+        for key, column in CATEGORICAL_FIELDS:
+            vocabulary, block = self.roster.indicator(column)
+            self._add_block(blocks, key, vocabulary, block)
+
+        self.matrix = (
+            np.hstack(blocks)
+            if blocks
+            else np.zeros((self.n_rows, 0), dtype=np.float32)
+        )
+        self.matrix = np.ascontiguousarray(self.matrix, dtype=np.float32)
+
+        self._build_cluster_index(df)
+
+    def _build_cluster_index(self, df):
+        """クラスタで絞り込む探索用に、クラスタ順に並べた指示行列とクラスタ中心を作成
+
+        クラスタ中心は指示行列のクラスタ内の平均で、クエリベクトルとの積が
+        そのクラスタのライバーの平均スコアになる。
+        """
+        self.cluster_order = None
+        self.cluster_bounds = None
+        self.cluster_matrix = None
+        self.centroids = None
+        if "cluster" not in df.columns or self.n_rows == 0:
+            return
+        labels = df["cluster"].to_numpy()
+        if labels.dtype.kind not in "iu":
+            return
+
+        # 同じクラスタの行が連続するように並べる（クラスタ内は元の行順）
+        order = np.argsort(labels, kind="stable")
+        sorted_labels = labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        self.cluster_order = order
+        self.cluster_bounds = np.r_[starts, self.n_rows]
+        self.cluster_matrix = np.ascontiguousarray(self.matrix[order])
+        sizes = np.diff(self.cluster_bounds).astype(np.float32)
+        self.centroids = np.ascontiguousarray(
+            np.add.reduceat(self.cluster_matrix, starts, axis=0) / sizes[:, None],
+            dtype=np.float32,
+        )
+
+    def _add_block(self, blocks, key, vocabulary, block):
+        offset = sum(b.shape[1] for b in blocks)
+        for j, value in enumerate(vocabulary):
+            self.columns[(key, value)] = offset + j
+        blocks.append(block)
+
+    def _column(self, key, value):
+        if not isinstance(value, Hashable):
+            return None
+        return self.columns.get((key, value))
+
+    def query_vector(self, preferences):
+        """嗜好を重み付きクエリベクトルに変換"""
+        query = np.zeros(self.matrix.shape[1], dtype=np.float32)
+
+        for key, _, _ in MULTI_LABEL_FIELDS:
+            selected = preferences.get(key)
+            if not selected:
+                continue
+            # 重複して選択された値は従来通り重複してカウントする
+            for value in selected:
+                column = self._column(key, value)
+                if column is not None:
+                    query[column] += SCORE_WEIGHTS[key]
+
+        for key, _ in CATEGORICAL_FIELDS:
+            value = preferences.get(key)
+            if not value:
+                continue
+            column = self._column(key, value)
+            if column is not None:
+                query[column] += SCORE_WEIGHTS[key]
+
+        return query
+
+    def query_matrix(self, preferences_list):
+        """複数の嗜好をクエリ行列（嗜好の数 × 嗜好値）に変換"""
+        queries = np.zeros(
+            (len(preferences_list), self.matrix.shape[1]), dtype=np.float32
+        )
+        for i, preferences in enumerate(preferences_list):
+            queries[i] = self.query_vector(preferences)
+        return queries
+
+    def score(self, preferences):
+        """全ライバーの推薦スコアを計算"""
+        return self.matrix @ self.query_vector(preferences)
+
+    def candidate_rows(self, preferences):
+        """選択した嗜好に1つ以上一致するライバーの行番号を昇順で返す"""
+        postings = []
+
+        for key, list_column, _ in MULTI_LABEL_FIELDS:
+            selected = preferences.get(key)
+            if not selected:
+                continue
+            column_index = self.index.get(list_column, {})
+            for value in selected:
+                if isinstance(value, Hashable) and value in column_index:
+                    postings.append(column_index[value])
+
+        for key, column in CATEGORICAL_FIELDS:
+            value = preferences.get(key)
+            if not value or not isinstance(value, Hashable):
+                continue
+            column_index = self.index.get(column, {})
+            if value in column_index:
+                postings.append(column_index[value])
+
+        if not postings:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(postings))
+
+    def top_k(self, preferences, k=10):
+        """推薦スコア上位k件の行番号を返す（同点は行番号の昇順）"""
+        candidates = self.candidate_rows(preferences)
+
+        # 候補が多い場合は全件を行列ベクトル積で採点した方が速い
+        if len(candidates) * 2 > self.n_rows:
+            return top_k_indices(self.score(preferences), k)
+
+        # 一致する行だけを採点する（一致しない行のスコアは常に0）
+        query = self.query_vector(preferences)
+        scores = self.matrix[candidates] @ query
+        winners = candidates[top_k_indices(scores, k)]
+
+        # 足りない分はスコア0の行を元の並び順で補う
+        missing = min(k, self.n_rows) - len(winners)
+        if missing > 0:
+            head = np.arange(min(self.n_rows, k + len(candidates)))
+            fillers = np.setdiff1d(head, candidates, assume_unique=True)[:missing]
+            winners = np.concatenate([winners, fillers])
+
+        return winners
+
+    def top_k_pruned(self, preferences, k=10, nprobe=1):
+        """クラスタで絞り込んで推薦スコア上位k件の行番号を返す（近似、同点は行番号の昇順）
+
+        クエリベクトルとクラスタ中心の積（クラスタ内の平均スコア）が高い順に
+        nprobe 個のクラスタを選び、そのライバーだけを採点する。選んだクラスタの
+        ライバーがk名に満たない場合は次のクラスタも採点する。nprobe を大きくすると
+        再現率が上がり、クラスタ数以上なら top_k と同じ結果になる。
+        """
+        n_clusters = 0 if self.centroids is None else len(self.centroids)
+        if nprobe >= n_clusters:
+            return self.top_k(preferences, k)
+
+        query = self.query_vector(preferences)
+        ranked = np.argsort(-(self.centroids @ query), kind="stable")
+        sizes = np.diff(self.cluster_bounds)[ranked]
+        enough = int(np.searchsorted(np.cumsum(sizes), min(k, self.n_rows))) + 1
+        probed = np.sort(ranked[: max(nprobe, enough)])
+
+        # クラスタ順の行列の連続した範囲だけを採点する
+        rows, scores = [], []
+        for cluster in probed:
+            start, end = self.cluster_bounds[cluster], self.cluster_bounds[cluster + 1]
+            rows.append(self.cluster_order[start:end])
+            scores.append(self.cluster_matrix[start:end] @ query)
+        return top_k_rows(np.concatenate(rows), np.concatenate(scores), k)
+
+    def top_k_batch(self, preferences_list, k=10):
+        """複数の嗜好それぞれの推薦スコア上位k件の行番号を返す
+
+        スコアはクエリ行列と指示行列の積1回でまとめて計算する（スコア行列が
+        大きくなりすぎないよう BATCH_SCORE_ELEMENTS ごとに分割する）。
+        並び順は top_k と同じ（同点は行番号の昇順）。
+        """
+        results = []
+        chunk_size = max(1, BATCH_SCORE_ELEMENTS // max(self.n_rows, 1))
+        for start in range(0, len(preferences_list), chunk_size):
+            queries = self.query_matrix(preferences_list[start : start + chunk_size])
+            scores = queries @ self.matrix.T
+            results.extend(top_k_indices(row, k) for row in scores)
+        return results
+
+    def recommend(self, preferences, k=10, nprobe=None):
+        """推薦スコア上位k件のライバー情報を返す
+
+        nprobe を指定するとクラスタで絞り込んで探索する（top_k_pruned）。
+        """
+        if nprobe is None:
+            return self.roster.records(self.top_k(preferences, k))
+        return self.roster.records(self.top_k_pruned(preferences, k, nprobe))
+
+    def recommend_batch(self, preferences_list, k=10):
+        """複数の嗜好それぞれの推薦スコア上位k件のライバー情報を返す"""
+        return [self.roster.records(rows) for rows in self.top_k_batch(preferences_list, k)]
@@ -0,0 +1,109 @@
+# データ再読み込みのバックグラウンドジョブ管理
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class ReloadJob:
+    """バックグラウンドで実行するデータ再読み込みジョブ"""
+
+    def __init__(self, options: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.options = options
+        self.status = "queued"  # queued / running / succeeded / failed
+        self.stage = "待機中"
+        self.progress = 0.0
+        self.message = ""
+        self.result: Optional[Dict[str, Any]] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def report_progress(self, stage: str, progress: float):
+        """進捗を更新（ジョブの処理関数から呼ばれる）"""
+        with self._lock:
+            self.stage = stage
+            self.progress = max(self.progress, min(progress, 1.0))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": round(self.progress, 3),
+                "message": self.message,
+                "result": self.result,
+                "options": self.options,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class ReloadJobManager:
+    """再読み込みジョブを1件ずつ実行する（実行中の要求は同じジョブにまとめる）"""
+
+    def __init__(self, max_history: int = 20):
+        self.max_history = max_history
+        self._jobs: "OrderedDict[str, ReloadJob]" = OrderedDict()
+        self._active: Optional[ReloadJob] = None
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        target: Callable[[Dict[str, Any], Callable[[str, float], None]], Dict[str, Any]],
+        options: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[ReloadJob, bool]:
+        """ジョブを開始する
+
+        実行中のジョブがあれば新しいジョブは作らずにそれを返す。
+        戻り値は (ジョブ, 新しく作成したかどうか)。
+        """
+        with self._lock:
+            if self._active is not None and self._active.active:
+                return self._active, False
+
+            job = ReloadJob(options or {})
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_history:
+                self._jobs.popitem(last=False)
+            self._active = job
+
+        threading.Thread(target=self._run, args=(job, target), daemon=True).start()
+        return job, True
+
+    def get(self, job_id: str) -> Optional[ReloadJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: ReloadJob, target):
+        with job._lock:
+            job.status = "running"
+            job.started_at = time.time()
+
+        try:
+            result = target(job.options, job.report_progress)
+            with job._lock:
+                job.result = result
+                job.message = result.get("message", "")
+                job.stage = "完了"
+                job.progress = 1.0
+                job.status = "succeeded"
+        except Exception as e:
+            with job._lock:
+                job.message = str(e)
+                job.status = "failed"
+        finally:
+            with job._lock:
+                job.finished_at = time.time()
+            with self._lock:
+                if self._active is job:
+                    self._active = None
@@ -0,0 +1,95 @@
+# 推薦結果のキャッシュ
+import threading
+import time
+from collections import OrderedDict
+
+
+def preference_cache_key(preferences):
+    """嗜好を正規化したキャッシュキーを作成
+
+    リストは並べ替え（スコアは選択順に依存しないため）、空の値は省く。
+    重複した選択はスコアに影響するので残す。正規化できない値が含まれる場合は
+    None を返す（キャッシュを使わない）。
+    """
+    items = []
+    for name in sorted(preferences):
+        value = preferences[name]
+        if not value:
+            continue
+        if isinstance(value, str):
+            items.append((name, value))
+        elif isinstance(value, (list, tuple)):
+            if not all(isinstance(v, str) for v in value):
+                return None
+            items.append((name, tuple(sorted(value))))
+        else:
+            return None
+    return tuple(items)
+
+
+class RecommendationCache:
+    """データセットのバージョンごとの推薦結果を保持するLRU/TTLキャッシュ"""
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (有効期限, 結果)
+        self._lock = threading.Lock()
+
+    def _sync_version(self, version):
+        """データセットが差し替わっていればキャッシュを破棄（古いバージョンならFalse）"""
+        if version == self.version:
+            return True
+        if self.version is not None and version < self.version:
+            return False
+        if self._entries:
+            self.invalidations += 1
+            self._entries.clear()
+        self.version = version
+        return True
+
+    def get(self, version, key):
+        """キャッシュ済みの結果を返す（なければ None）"""
+        with self._lock:
+            if not self._sync_version(version):
+                self.misses += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, version, key, result):
+        with self._lock:
+            # 計算中にデータセットが差し替わった場合は古い結果を保存しない
+            if not self._sync_version(version):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "dataset_version": self.version,
+            }
@@ -0,0 +1,523 @@
+# 辞書エンコードでコンパクトに保持するロスター
+import sys
+from collections.abc import Hashable, Mapping
+
+import numpy as np
+
+
+def _native(value):
+    """numpy のスカラーをJSONに変換できるPythonの値にする"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _narrow_integers(values):
+    """値の範囲が収まる最も小さい整数型に変換"""
+    if len(values) == 0:
+        return values.astype(np.uint8)
+    low, high = values.min(), values.max()
+    dtype = np.result_type(np.min_scalar_type(low), np.min_scalar_type(high))
+    return values.astype(dtype)
+
+
+def _narrow_floats(values):
+    """float32 で値が変わらない場合だけ float32 に変換"""
+    with np.errstate(over="ignore"):
+        narrowed = values.astype(np.float32)
+    if np.array_equal(narrowed.astype(values.dtype), values, equal_nan=True):
+        return narrowed
+    return values
+
+
+class StringTable:
+    """全列で共有する文字列テーブル（文字列 -> 番号）"""
+
+    def __init__(self):
+        self.strings = []
+        self.codes = {}
+        self._array = None
+
+    def __len__(self):
+        return len(self.strings)
+
+    def encode(self, values):
+        """文字列の列を番号の配列に変換（新しい文字列は末尾に追加）"""
+        codes = np.empty(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.strings)
+                self.strings.append(value)
+            codes[i] = code
+        self._array = None
+        return codes
+
+    def decode(self, codes):
+        """番号の配列を文字列のリストに戻す"""
+        if self._array is None:
+            self._array = np.array(self.strings, dtype=object)
+        return self._array[codes].tolist()
+
+    @property
+    def nbytes(self):
+        return (
+            sum(sys.getsizeof(s) for s in self.strings)
+            + sys.getsizeof(self.strings)
+            + sys.getsizeof(self.codes)
+            + 8 * len(self.strings)
+        )
+
+
+class MappedStringTable:
+    """ファイルに書き出した文字列テーブル（UTF-8 の連結バイト列と開始位置）
+
+    配列はメモリマップしたものをそのまま使い、文字列は参照された分だけ
+    その都度復元する。そのため複数のプロセスで開いてもプロセスごとの
+    メモリは増えない。
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+        self._buffer = memoryview(data) if len(data) else b""
+        self._codes = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def codes(self):
+        # 文字列 -> 番号 は指示行列の作成でのみ使うため、必要になった時点で作る
+        if self._codes is None:
+            strings = self.decode(np.arange(len(self)))
+            self._codes = {value: code for code, value in enumerate(strings)}
+        return self._codes
+
+    def get(self, code):
+        """番号 code の文字列"""
+        start, end = self.offsets[code : code + 2].tolist()
+        return str(self._buffer[start:end], "utf-8")
+
+    def decode(self, codes):
+        """番号の配列を文字列のリストに戻す"""
+        codes = np.asarray(codes, dtype=np.int64)
+        starts = self.offsets[codes].tolist()
+        ends = self.offsets[codes + 1].tolist()
+        buffer = self._buffer
+        return [str(buffer[start:end], "utf-8") for start, end in zip(starts, ends)]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes
+
+
+class NumericColumn:
+    """数値の列（値の範囲に合う最も小さい型で保持）"""
+
+    kind = "numeric"
+
+    def __init__(self, values):
+        if values.dtype.kind in "iu":
+            values = _narrow_integers(values)
+        elif values.dtype.kind == "f":
+            values = _narrow_floats(values)
+        self.values = values
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    @property
+    def dtype(self):
+        return str(self.values.dtype)
+
+    def take(self, rows=None):
+        values = self.values if rows is None else self.values[rows]
+        return values.tolist()
+
+    def indicator(self):
+        return _object_indicator(self.take())
+
+
+class BitsetBlock:
+    """0/1 だけの列（ワンホット列など）をまとめ、1名分を1つのビット列に詰めて保持
+
+    行ごとに詰めるため、数行分の全列を1回の展開で復元できる。
+    """
+
+    def __init__(self, names, columns):
+        self.names = list(names)
+        self.booleans = [values.dtype == bool for values in columns]
+        matrix = np.column_stack([values.astype(bool) for values in columns])
+        self.bits = np.packbits(matrix, axis=1)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def unpack(self, rows=None):
+        """指定した行（省略時は全行）の 行 × 列 の 0/1 配列を返す"""
+        bits = self.bits if rows is None else self.bits[rows]
+        return np.unpackbits(bits, axis=1, count=len(self.names))
+
+    def take(self, rows=None):
+        """列ごとの値のリストを返す"""
+        columns = self.unpack(rows).T.tolist()
+        for j, boolean in enumerate(self.booleans):
+            if boolean:
+                columns[j] = [bool(value) for value in columns[j]]
+        return columns
+
+
+class BitColumn:
+    """BitsetBlock に詰めた1列"""
+
+    kind = "bits"
+    dtype = "bit"
+
+    def __init__(self, block, position):
+        self.block = block
+        self.position = position
+
+    @property
+    def nbytes(self):
+        return self.block.nbytes / len(self.block.names)
+
+    def take(self, rows=None):
+        values = self.block.unpack(rows)[:, self.position]
+        return values.astype(bool if self.block.booleans[self.position] else np.int64).tolist()
+
+    def indicator(self):
+        return _object_indicator(self.take())
+
+
+class CategoryColumn:
+    """文字列の列（共有の文字列テーブルの番号で保持）"""
+
+    kind = "category"
+
+    def __init__(self, values, table):
+        self.table = table
+        self.codes = table.encode(values)
+
+    def narrow(self):
+        # テーブルの作成後に番号の範囲に合う最も小さい型にする
+        self.codes = _narrow_integers(self.codes)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    @property
+    def dtype(self):
+        return str(self.codes.dtype)
+
+    def take(self, rows=None):
+        return self.table.decode(self.codes if rows is None else self.codes[rows])
+
+    def indicator(self):
+        """値の語彙と、行 × 語彙の指示行列（float32）を返す"""
+        present = np.unique(self.codes)
+        vocabulary = sorted(self.table.decode(present), key=str)
+        block = np.zeros((len(self.codes), len(vocabulary)), dtype=np.float32)
+        for j, value in enumerate(vocabulary):
+            block[:, j] = self.codes == self.table.codes[value]
+        return vocabulary, block
+
+
+class ListColumn:
+    """文字列のリストの列（行ごとの開始位置と、連結した番号の配列で保持）"""
+
+    kind = "list"
+
+    def __init__(self, values, table):
+        self.table = table
+        lengths = np.fromiter((len(items) for items in values), np.int64, len(values))
+        self.offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.codes = table.encode([value for items in values for value in items])
+
+    def narrow(self):
+        self.offsets = _narrow_integers(self.offsets)
+        self.codes = _narrow_integers(self.codes)
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.codes.nbytes
+
+    @property
+    def dtype(self):
+        return f"{self.codes.dtype}[]"
+
+    def take(self, rows=None):
+        if rows is None:
+            values = self.table.decode(self.codes)
+            offsets = self.offsets.tolist()
+            return [values[start:end] for start, end in zip(offsets, offsets[1:])]
+        # 指定した行の番号をまとめて取り出して1回で復元し、行ごとに切り分ける
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.offsets[rows].astype(np.int64)
+        lengths = self.offsets[rows + 1].astype(np.int64) - starts
+        ends = np.cumsum(lengths)
+        positions = np.arange(ends[-1] if len(ends) else 0) + np.repeat(
+            starts - (ends - lengths), lengths
+        )
+        values = self.table.decode(self.codes[positions])
+        ends = ends.tolist()
+        return [values[end - length : end] for end, length in zip(ends, lengths.tolist())]
+
+    def indicator(self):
+        """値の語彙と、行 × 語彙の指示行列（float32、重複した値も1）を返す"""
+        present = np.unique(self.codes)
+        vocabulary = sorted(self.table.decode(present), key=str)
+        # 文字列テーブルの番号 -> 語彙での位置
+        positions = np.full(len(self.table), -1, dtype=np.int64)
+        for j, value in enumerate(vocabulary):
+            positions[self.table.codes[value]] = j
+        n_rows = len(self.offsets) - 1
+        rows = np.repeat(np.arange(n_rows), np.diff(self.offsets))
+        block = np.zeros((n_rows, len(vocabulary)), dtype=np.float32)
+        block[rows, positions[self.codes]] = 1.0
+        return vocabulary, block
+
+
+class ObjectColumn:
+    """上記のどれにも当てはまらない列（値をそのまま保持）"""
+
+    kind = "object"
+    dtype = "object"
+
+    def __init__(self, values):
+        self.values = [_native(value) for value in values]
+
+    @property
+    def nbytes(self):
+        return sys.getsizeof(self.values) + sum(sys.getsizeof(v) for v in self.values)
+
+    def take(self, rows=None):
+        if rows is None:
+            return list(self.values)
+        return [self.values[i] for i in rows]
+
+    def indicator(self):
+        return _object_indicator(self.values)
+
+
+def _object_indicator(values):
+    """リストの値は要素ごと、それ以外のハッシュ可能な値は値そのものを語彙にした指示行列"""
+    vocabulary = set()
+    for value in values:
+        if isinstance(value, (list, tuple)):
+            vocabulary.update(item for item in value if isinstance(item, Hashable))
+        elif isinstance(value, Hashable):
+            vocabulary.add(value)
+    vocabulary = sorted(vocabulary, key=str)
+    positions = {value: j for j, value in enumerate(vocabulary)}
+    block = np.zeros((len(values), len(vocabulary)), dtype=np.float32)
+    for i, value in enumerate(values):
+        items = value if isinstance(value, (list, tuple)) else [value]
+        for item in items:
+            if isinstance(item, Hashable) and item in positions:
+                block[i, positions[item]] = 1.0
+    return vocabulary, block
+
+
+def _is_bits(series):
+    """0/1 だけの整数の列または bool の列か"""
+    if not isinstance(series.dtype, np.dtype) or series.dtype.kind not in "iub":
+        return False
+    values = series.to_numpy()
+    return series.dtype == bool or (
+        len(values) > 0 and values.min() >= 0 and values.max() <= 1
+    )
+
+
+def _build_column(series, table):
+    values = series.to_numpy()
+    if not isinstance(series.dtype, np.dtype):
+        # pandas の拡張型（Int64 など）はそのまま保持する
+        return ObjectColumn(series.tolist())
+    if values.dtype.kind in "iub":
+        return NumericColumn(values)
+    if values.dtype.kind == "f":
+        return NumericColumn(values)
+    if values.dtype == object:
+        if all(type(value) is str for value in values):
+            return CategoryColumn(values, table)
+        if all(
+            type(items) is list and all(type(value) is str for value in items)
+            for items in values
+        ):
+            return ListColumn(values, table)
+    return ObjectColumn(series.tolist())
+
+
+class RowView(Mapping):
+    """ロスターの1行を読む読み取り専用のビュー（参照した列だけを復元する）"""
+
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, column):
+        return self._store.value(self._row, column)
+
+    def __iter__(self):
+        return iter(self._store.column_names)
+
+    def __len__(self):
+        return len(self._store.column_names)
+
+    def __repr__(self):
+        return f"RowView({self._row}, {dict(self)!r})"
+
+
+class RosterStore:
+    """ロスターを列ごとにコンパクトな形式で保持する読み取り専用のストア
+
+    文字列の列は全列で共有する文字列テーブルの番号、文字列のリストの列は
+    行ごとの開始位置と番号の配列、0/1 だけの列（ワンホット列）は全列まとめて
+    1名あたりのビット列、その他の数値の列は値の範囲に合う最も小さい型で保持する。
+    復元した値は DataFrame.to_dict("records") と同じ（JSONに変換できる
+    Pythonの値）になる。
+    """
+
+    def __init__(self, column_names, columns, table, n_rows, bitset=None):
+        self.column_names = list(column_names)
+        self.columns = dict(zip(self.column_names, columns))
+        self.table = table
+        self.n_rows = n_rows
+        self.bitset = bitset
+
+    @classmethod
+    def from_frame(cls, df):
+        """DataFrame からストアを作成"""
+        table = StringTable()
+        df = df.reset_index(drop=True)
+
+        # 値の種類が少ない列から文字列テーブルに登録し、小さい番号を割り当てる
+        # （性別・配信時間などの番号が1バイトに収まるようにするため）
+        def cardinality(column):
+            series = df[column]
+            if series.dtype != object:
+                return 0
+            try:
+                return series.nunique(dropna=False)
+            except TypeError:  # リストの列
+                return sum(len(items) for items in series if isinstance(items, list))
+
+        bit_names = [c for c in df.columns if _is_bits(df[c])] if len(df) else []
+        bitset = None
+        columns = {}
+        if bit_names:
+            bitset = BitsetBlock(bit_names, [df[c].to_numpy() for c in bit_names])
+            for position, column in enumerate(bit_names):
+                columns[column] = BitColumn(bitset, position)
+        for column in sorted(df.columns, key=cardinality):
+            if column not in columns:
+                columns[column] = _build_column(df[column], table)
+        for column in columns.values():
+            if hasattr(column, "narrow"):
+                column.narrow()
+        return cls(
+            df.columns, [columns[c] for c in df.columns], table, len(df), bitset
+        )
+
+    def __len__(self):
+        return self.n_rows
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def row(self, i):
+        """i 行目のビューを返す"""
+        if not 0 <= i < self.n_rows:
+            raise IndexError(f"行番号が範囲外です: {i}")
+        return RowView(self, i)
+
+    def value(self, row, column):
+        """row 行目の column の値を返す"""
+        return self.columns[column].take([row])[0]
+
+    def column(self, column):
+        """column の全行の値をリストで返す"""
+        return self.columns[column].take()
+
+    def indicator(self, column):
+        """column の値の語彙と、行 × 語彙の指示行列を返す（リストの列は要素ごと）"""
+        if column not in self.columns:
+            return [], np.zeros((self.n_rows, 0), dtype=np.float32)
+        return self.columns[column].indicator()
+
+    def records(self, rows=None):
+        """指定した行（省略時は全行）を列名 -> 値の辞書のリストで返す"""
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+        # 0/1 の列はまとめて1回で展開する
+        bits = {}
+        if self.bitset is not None:
+            bits = dict(zip(self.bitset.names, self.bitset.take(rows)))
+        values = [
+            bits[c] if c in bits else self.columns[c].take(rows)
+            for c in self.column_names
+        ]
+        return [dict(zip(self.column_names, row)) for row in zip(*values)]
+
+    @property
+    def nbytes(self):
+        total = self.table.nbytes + (self.bitset.nbytes if self.bitset else 0)
+        return total + sum(
+            c.nbytes for c in self.columns.values() if not isinstance(c, BitColumn)
+        )
+
+    def memory_report(self):
+        """列ごとの形式・メモリ使用量と、ライバー1名あたりのバイト数を返す"""
+        return {
+            "n_rows": self.n_rows,
+            "total_bytes": self.nbytes,
+            "bytes_per_liver": round(self.nbytes / max(self.n_rows, 1), 1),
+            "string_table": {"size": len(self.table), "bytes": self.table.nbytes},
+            "columns": {
+                name: {"kind": c.kind, "dtype": c.dtype, "bytes": round(c.nbytes, 1)}
+                for name, c in self.columns.items()
+            },
+        }
+
+
+def frame_memory_per_liver(df):
+    """比較用: DataFrame と to_dict("records") の1名あたりのバイト数
+
+    辞書のリストは DataFrame と共有している文字列・リストを除いた分を数える。
+    """
+    n_rows = max(len(df), 1)
+    frame_bytes = int(df.memory_usage(deep=True, index=True).sum())
+    records = df.to_dict("records")
+    records_bytes = sys.getsizeof(records) + sum(
+        sys.getsizeof(record)
+        + sum(sys.getsizeof(v) for v in record.values() if not isinstance(v, (str, list)))
+        for record in records
+    )
+    return {
+        "dataframe": round(frame_bytes / n_rows, 1),
+        "records": round(records_bytes / n_rows, 1),
+    }
+
+
+if __name__ == "__main__":
+    # テスト実行
+    from data.synthetic_data import create_synthetic_vtuber_data
+    from data.vtuber_data import encode_categorical_features
+
+    df = encode_categorical_features(create_synthetic_vtuber_data(10_000))
+    store = RosterStore.from_frame(df)
+    report = store.memory_report()
+    baseline = frame_memory_per_liver(df)
+
+    print(f"ライバー数: {report['n_rows']}, 文字列テーブル: {report['string_table']['size']}件")
+    print(f"1名あたり: ストア {report['bytes_per_liver']}バイト, "
+          f"DataFrame {baseline['dataframe']}バイト, "
+          f"辞書のリスト {baseline['records']}バイト")
+    for name, column in report["columns"].items():
+        print(f"  {name:30s} {column['kind']:8s} {column['dtype']:8s} {column['bytes']:>8}")
+    print(store.row(0)["name"], store.row(0)["streaming_genres"])
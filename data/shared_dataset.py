@@ -0,0 +1,606 @@
+# 複数のサーバープロセスで共有するデータセット（共有ディレクトリのファイルをメモリマップする）
+#
+# 世代ごとのディレクトリに推薦用の指示行列・転置インデックス・ロスター・類似検索の
+# ベクトル・地図の座標・/api/vtubers の本文を書き出し、全て書き終えてから世代番号を進める。
+# 各プロセスは世代番号だけを確認し、変わっていれば新しい世代をメモリマップで開き直す。
+# 配列はコピーせずにページキャッシュを共有するため、プロセスを増やしても
+# データセットのメモリは増えない。
+import fcntl
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from data.dataset import Dataset
+from data.prepared_response import FilePreparedResponse
+from data.projection import MapProjection
+from data.recommender import RecommendationEngine
+from data.roster_store import (
+    BitColumn,
+    BitsetBlock,
+    CategoryColumn,
+    ListColumn,
+    MappedStringTable,
+    NumericColumn,
+    ObjectColumn,
+    RosterStore,
+)
+from data.similarity import SimilarityIndex
+
+# 共有ディレクトリを指定する環境変数（設定するとアプリは共有モードで動く）
+SHARED_DIR_ENV = "VTUBER_SHARED_DIR"
+
+GENERATION_FILE = "GENERATION"
+LOCK_FILE = "publish.lock"
+MANIFEST_FILE = "manifest.json"
+SNAPSHOT_DIR = "snapshot"
+
+# 世代ディレクトリの形式のバージョン（形式を変えたら上げる）
+SHARED_FORMAT_VERSION = 3
+
+# 残しておく過去の世代数（切り替え中のプロセスが読み終えるまで消さないため）
+KEEP_GENERATIONS = 3
+
+# 列の種類 -> (列のクラス, 書き出す配列の属性)
+COLUMN_TYPES = {
+    "numeric": (NumericColumn, ("values",)),
+    "category": (CategoryColumn, ("codes",)),
+    "list": (ListColumn, ("offsets", "codes")),
+}
+
+# 推薦エンジンのクラスタで絞り込む探索用の配列
+ENGINE_CLUSTER_ARRAYS = ("cluster_order", "cluster_bounds", "cluster_matrix", "centroids")
+
+
+class SharedDatasetError(Exception):
+    """共有データセットの世代を開けない"""
+
+
+def _native(value):
+    """numpy のスカラーをJSONに変換できるPythonの値にする"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _generation_name(generation):
+    return f"gen-{generation:010d}"
+
+
+def _save_array(directory, name, array):
+    np.save(os.path.join(directory, name), np.ascontiguousarray(array), allow_pickle=False)
+    return name
+
+
+def _map_array(directory, name):
+    """読み取り専用でメモリマップした配列（ndarray のビュー）を返す"""
+    try:
+        return np.asarray(
+            np.load(os.path.join(directory, name), mmap_mode="r", allow_pickle=False)
+        )
+    except (OSError, ValueError) as e:
+        raise SharedDatasetError(f"配列を開けません: {name}: {e}") from e
+
+
+def _offsets(lengths):
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(np.asarray(lengths, dtype=np.int64), out=offsets[1:])
+    return offsets
+
+
+def _restore(cls, **attributes):
+    """__init__ を通さずに属性だけを設定したオブジェクトを作る"""
+    obj = cls.__new__(cls)
+    obj.__dict__.update(attributes)
+    return obj
+
+
+def _save_roster(store, directory):
+    """ロスターのストアを書き出す（文字列テーブルは UTF-8 の連結バイト列と開始位置）"""
+    strings = _save_strings(
+        directory, "roster_strings", store.table.decode(np.arange(len(store.table)))
+    )
+
+    columns = []
+    for i, name in enumerate(store.column_names):
+        column = store.columns[name]
+        entry = {"name": name, "kind": column.kind}
+        if isinstance(column, BitColumn):
+            entry["position"] = column.position
+        elif isinstance(column, ObjectColumn):
+            entry["values"] = column.values
+        else:
+            entry["arrays"] = {
+                attr: _save_array(directory, f"roster_{i:04d}_{attr}.npy", getattr(column, attr))
+                for attr in COLUMN_TYPES[column.kind][1]
+            }
+        columns.append(entry)
+
+    bitset = None
+    if store.bitset is not None:
+        bitset = {
+            "names": store.bitset.names,
+            "booleans": [bool(b) for b in store.bitset.booleans],
+            "bits": _save_array(directory, "roster_bits.npy", store.bitset.bits),
+        }
+    return {
+        "n_rows": store.n_rows,
+        "strings": strings,
+        "columns": columns,
+        "bitset": bitset,
+    }
+
+
+def _open_roster(manifest, directory):
+    table = _map_strings(directory, manifest["strings"])
+    bitset = None
+    if manifest["bitset"] is not None:
+        bitset = _restore(
+            BitsetBlock,
+            names=manifest["bitset"]["names"],
+            booleans=manifest["bitset"]["booleans"],
+            bits=_map_array(directory, manifest["bitset"]["bits"]),
+        )
+
+    columns = []
+    for entry in manifest["columns"]:
+        if entry["kind"] == "bits":
+            column = BitColumn(bitset, entry["position"])
+        elif entry["kind"] == "object":
+            column = _restore(ObjectColumn, values=entry["values"])
+        else:
+            cls, _ = COLUMN_TYPES[entry["kind"]]
+            arrays = {
+                attr: _map_array(directory, name) for attr, name in entry["arrays"].items()
+            }
+            if cls is not NumericColumn:
+                arrays["table"] = table
+            column = _restore(cls, **arrays)
+        columns.append(column)
+    return RosterStore(
+        [entry["name"] for entry in manifest["columns"]],
+        columns,
+        table,
+        manifest["n_rows"],
+        bitset,
+    )
+
+
+def _save_engine(engine, directory):
+    """推薦エンジンの指示行列と転置インデックス（値ごとの行番号を連結したもの）を書き出す"""
+    _save_array(directory, "engine_matrix.npy", engine.matrix)
+    index = {}
+    for i, (column, postings) in enumerate(engine.index.items()):
+        values = list(postings)
+        rows = [np.asarray(postings[value], dtype=np.int64) for value in values]
+        index[column] = {
+            "values": [_native(value) for value in values],
+            "offsets": _save_array(
+                directory, f"index_{i:02d}_offsets.npy", _offsets([len(r) for r in rows])
+            ),
+            "rows": _save_array(
+                directory,
+                f"index_{i:02d}_rows.npy",
+                np.concatenate(rows) if rows else np.empty(0, dtype=np.int64),
+            ),
+        }
+    clusters = None
+    if engine.cluster_order is not None:
+        clusters = {
+            attr: _save_array(directory, f"engine_{attr}.npy", getattr(engine, attr))
+            for attr in ENGINE_CLUSTER_ARRAYS
+        }
+    return {
+        "columns": [
+            [key, _native(value), column] for (key, value), column in engine.columns.items()
+        ],
+        "index": index,
+        "clusters": clusters,
+    }
+
+
+def _open_engine(manifest, directory, roster):
+    index = {}
+    for column, entry in manifest["index"].items():
+        offsets = _map_array(directory, entry["offsets"]).tolist()
+        rows = _map_array(directory, entry["rows"])
+        # 行番号の配列はメモリマップした配列のスライス（コピーしない）
+        index[column] = {
+            value: rows[start:end]
+            for value, start, end in zip(entry["values"], offsets, offsets[1:])
+        }
+    # クラスタで絞り込む探索用の配列（クラスタがない場合は None）
+    clusters = dict.fromkeys(ENGINE_CLUSTER_ARRAYS)
+    if manifest["clusters"] is not None:
+        clusters = {
+            attr: _map_array(directory, name) for attr, name in manifest["clusters"].items()
+        }
+    return _restore(
+        RecommendationEngine,
+        df=None,
+        n_rows=len(roster),
+        index=index,
+        roster=roster,
+        columns={(key, value): column for key, value, column in manifest["columns"]},
+        matrix=_map_array(directory, "engine_matrix.npy"),
+        **clusters,
+    )
+
+
+class SortedNames:
+    """名前 -> 行番号 の辞書の代わりに、名前順に並べた名前を二分探索する
+
+    名前の文字列テーブルもメモリマップしたものを使うため、プロセスごとに
+    全ライバー分の辞書を作らずに済む。同名のライバーは先頭の行を返す。
+    """
+
+    def __init__(self, names, rows):
+        self.names = names
+        self.rows = rows
+
+    def get(self, name, default=None):
+        if not isinstance(name, str):
+            return default
+        low, high = 0, len(self.rows)
+        while low < high:
+            middle = (low + high) // 2
+            if self.names.get(middle) < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.rows) and self.names.get(low) == name:
+            return int(self.rows[low])
+        return default
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, name):
+        row = self.get(name)
+        if row is None:
+            raise KeyError(name)
+        return row
+
+
+def _save_strings(directory, prefix, strings):
+    """文字列のリストを UTF-8 の連結バイト列と開始位置として書き出す"""
+    encoded = [s.encode("utf-8") for s in strings]
+    return {
+        "data": _save_array(
+            directory, f"{prefix}_data.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        ),
+        "offsets": _save_array(
+            directory, f"{prefix}_offsets.npy", _offsets([len(s) for s in encoded])
+        ),
+    }
+
+
+def _map_strings(directory, manifest):
+    return MappedStringTable(
+        _map_array(directory, manifest["data"]), _map_array(directory, manifest["offsets"])
+    )
+
+
+def _save_similarity(similarity, directory):
+    if similarity is None:
+        return None
+    names = [str(name) for name in similarity.names]
+    # 名前順（同名は行番号順）に並べた行番号と名前
+    name_rows = sorted(range(len(names)), key=names.__getitem__)
+    return {
+        "n_rows": similarity.n_rows,
+        "vectors": _save_array(directory, "similarity_vectors.npy", similarity.vectors),
+        "order": _save_array(directory, "similarity_order.npy", similarity.order),
+        "positions": _save_array(directory, "similarity_positions.npy", similarity.positions),
+        "names": _save_strings(
+            directory, "similarity_names", [names[row] for row in name_rows]
+        ),
+        "name_rows": _save_array(
+            directory, "similarity_name_rows.npy", np.array(name_rows, dtype=np.int64)
+        ),
+        "clusters": (
+            _save_array(directory, "similarity_clusters.npy", similarity.clusters)
+            if similarity.clusters is not None
+            else None
+        ),
+        "cluster_bounds": [
+            [_native(cluster), start, end]
+            for cluster, (start, end) in similarity.cluster_bounds.items()
+        ],
+    }
+
+
+def _open_similarity(manifest, directory, roster):
+    if manifest is None:
+        return None
+    return _restore(
+        SimilarityIndex,
+        n_rows=manifest["n_rows"],
+        roster=roster,
+        rows=SortedNames(
+            _map_strings(directory, manifest["names"]),
+            _map_array(directory, manifest["name_rows"]),
+        ),
+        vectors=_map_array(directory, manifest["vectors"]),
+        order=_map_array(directory, manifest["order"]),
+        positions=_map_array(directory, manifest["positions"]),
+        clusters=(
+            _map_array(directory, manifest["clusters"])
+            if manifest["clusters"] is not None
+            else None
+        ),
+        cluster_bounds={
+            cluster: (start, end) for cluster, start, end in manifest["cluster_bounds"]
+        },
+    )
+
+
+def _save_projection(projection, directory):
+    if projection is None:
+        return None
+    return {
+        "coords": _save_array(directory, "map_coords.npy", projection.coords),
+        "clusters": _save_array(directory, "map_clusters.npy", projection.clusters),
+        "x_order": _save_array(directory, "map_x_order.npy", projection.x_order),
+        "sorted_x": _save_array(directory, "map_sorted_x.npy", projection.sorted_x),
+        "explained_variance_ratio": projection.explained_variance_ratio,
+    }
+
+
+def _open_projection(manifest, directory):
+    if manifest is None:
+        return None
+    return MapProjection(
+        _map_array(directory, manifest["coords"]),
+        _map_array(directory, manifest["clusters"]),
+        manifest["explained_variance_ratio"],
+        x_order=_map_array(directory, manifest["x_order"]),
+        sorted_x=_map_array(directory, manifest["sorted_x"]),
+    )
+
+
+def _save_response(response, directory):
+    """/api/vtubers の本文を圧縮形式ごとのファイルに書き出す"""
+    files = {}
+    for encoding, body in response.encoded.items():
+        files[encoding] = f"vtubers.{encoding}"
+        with open(os.path.join(directory, files[encoding]), "wb") as f:
+            f.write(body)
+    return {"mimetype": response.mimetype, "files": files, "etags": response.etags}
+
+
+def _save_training_state(dataset, directory):
+    """差分更新・再学習用にロスターと学習結果をスナップショットとして書き出す"""
+    if dataset.kmeans is None or getattr(dataset.scaler, "matrix_", None) is None:
+        return False
+    from data.snapshot import save_snapshot
+
+    save_snapshot(
+        dataset.df,
+        dataset.clusters,
+        dataset.scaler,
+        dataset.kmeans,
+        snapshot_dir=os.path.join(directory, SNAPSHOT_DIR),
+    )
+    return True
+
+
+def _remove_unused_generation(directory):
+    """世代のディレクトリを、使っているプロセスがなければ削除する"""
+    try:
+        fd = os.open(os.path.join(directory, MANIFEST_FILE), os.O_RDONLY)
+    except OSError:
+        # manifest がなければ開けるプロセスもない
+        shutil.rmtree(directory, ignore_errors=True)
+        return
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            print(f"使用中のため共有データセットの世代を残します: {os.path.basename(directory)}")
+            return
+        # 削除が終わるまで排他ロックを持ち続ける（その間は新しく開けない）
+        shutil.rmtree(directory, ignore_errors=True)
+    finally:
+        os.close(fd)
+
+
+class GenerationLock:
+    """世代のディレクトリを使っている間、削除されないように持つ共有ロック
+
+    世代の manifest に flock の共有ロックをかける。ロックはこのオブジェクトが
+    参照されなくなった時（プロセスが終了した場合も）に外れる。古い世代を削除する
+    側は排他ロックを取れた世代だけを削除する。
+    """
+
+    def __init__(self, directory):
+        self._fd = os.open(os.path.join(directory, MANIFEST_FILE), os.O_RDONLY)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self):
+        self.close()
+
+
+class SharedDatasetStore:
+    """共有ディレクトリに書き出したデータセットの世代を管理するクラス
+
+    publish は新しい世代のディレクトリを書き終えてから世代番号を進める。
+    世代番号は8バイトのファイルで、各プロセスはメモリマップして読むため
+    確認にシステムコールは要らない。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._counter = None
+        self._opened: Optional[Dataset] = None
+        self._failed_generation = None
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        """現在の世代番号（まだ公開されていなければ0）"""
+        if self._counter is None:
+            try:
+                with open(os.path.join(self.directory, GENERATION_FILE), "rb") as f:
+                    self._counter = mmap.mmap(f.fileno(), 8, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return 0
+        return int.from_bytes(self._counter[:8], "little")
+
+    def _write_counter(self, generation):
+        path = os.path.join(self.directory, GENERATION_FILE)
+        if not os.path.exists(path):
+            # 読み込み側がメモリマップし続けるため、作成後は置き換えず書き換えるだけにする
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(bytes(8))
+            os.replace(f"{path}.tmp", path)
+        with open(path, "r+b") as f:
+            with mmap.mmap(f.fileno(), 8) as counter:
+                counter[:8] = generation.to_bytes(8, "little")
+
+    def publish(self, dataset) -> Dataset:
+        """データセットを新しい世代として書き出し、世代番号を進める
+
+        複数のプロセスが同時に公開しても、ファイルロックで1つずつ書き出す。
+        戻り値は書き出した世代をメモリマップで開いたデータセットで、refresh が
+        返すデータセットもこれに置き換わる。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            generation = self.generation() + 1
+            name = _generation_name(generation)
+            work_dir = os.path.join(self.directory, f".{name}.tmp")
+            shutil.rmtree(work_dir, ignore_errors=True)
+            os.makedirs(work_dir)
+            try:
+                manifest = {
+                    "version": SHARED_FORMAT_VERSION,
+                    "generation": generation,
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "roster": _save_roster(dataset.recommender.roster, work_dir),
+                    "engine": _save_engine(dataset.recommender, work_dir),
+                    "similarity": _save_similarity(dataset.similarity, work_dir),
+                    "response": _save_response(dataset.vtubers_response, work_dir),
+                    "projection": _save_projection(dataset.projection, work_dir),
+                    "clusters": (
+                        _save_array(work_dir, "clusters.npy", np.asarray(dataset.clusters))
+                        if dataset.clusters is not None
+                        else None
+                    ),
+                    "snapshot": _save_training_state(dataset, work_dir),
+                }
+                # manifest は最後に書く（manifest がある = 全ファイルが揃っている）
+                with open(os.path.join(work_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                    json.dump(manifest, f, ensure_ascii=False)
+                os.rename(work_dir, os.path.join(self.directory, name))
+            except Exception:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                raise
+            self._write_counter(generation)
+            self._remove_old_generations(generation)
+        print(f"共有データセットの世代{generation}を公開しました")
+        opened = self.open(generation)
+        with self._lock:
+            # 以前に開いた世代への参照を外す（ロックが外れ、次回以降の公開で削除できる）
+            self._opened = opened
+        return opened
+
+    def _remove_old_generations(self, generation):
+        """古い世代と書き込み途中で残った作業ディレクトリを削除
+
+        /api/vtubers の本文は送信のたびにファイルを開くため、まだ使っている
+        プロセスがある世代（GenerationLock の共有ロックがかかっている世代）は
+        削除せず、次回の公開時にもう一度確認する。
+        """
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            if entry.startswith(".gen-") and entry.endswith(".tmp"):
+                shutil.rmtree(path, ignore_errors=True)
+            elif entry.startswith("gen-") and entry[4:].isdigit():
+                if int(entry[4:]) <= generation - KEEP_GENERATIONS:
+                    _remove_unused_generation(path)
+
+    def open(self, generation=None) -> Dataset:
+        """世代（省略時は現在の世代）をメモリマップで開いたデータセットを返す
+
+        返すデータセットが使われている間は世代のディレクトリが削除されないよう、
+        最初に GenerationLock を取る（本文やスナップショットは後から開くため）。
+        """
+        generation = self.generation() if generation is None else generation
+        directory = os.path.join(self.directory, _generation_name(generation))
+        try:
+            lock = GenerationLock(directory)
+            with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise SharedDatasetError(f"世代{generation}を開けません: {e}") from e
+        if manifest.get("version") != SHARED_FORMAT_VERSION:
+            raise SharedDatasetError(
+                f"共有データセットの形式のバージョンが異なります: {manifest.get('version')}"
+            )
+
+        try:
+            roster = _open_roster(manifest["roster"], directory)
+            response = manifest["response"]
+            return Dataset(
+                df=None,
+                clusters=(
+                    _map_array(directory, manifest["clusters"])
+                    if manifest["clusters"] is not None
+                    else None
+                ),
+                scaler=None,
+                kmeans=None,
+                recommender=_open_engine(manifest["engine"], directory, roster),
+                vtubers_response=FilePreparedResponse(
+                    {
+                        encoding: os.path.join(directory, name)
+                        for encoding, name in response["files"].items()
+                    },
+                    response["etags"],
+                    response["mimetype"],
+                    keep_alive=lock,
+                ),
+                similarity=_open_similarity(manifest["similarity"], directory, roster),
+                version=generation,
+                snapshot_dir=(
+                    os.path.join(directory, SNAPSHOT_DIR) if manifest["snapshot"] else None
+                ),
+                projection=_open_projection(manifest["projection"], directory),
+            )
+        except (KeyError, TypeError, OSError) as e:
+            raise SharedDatasetError(f"世代{generation}の内容が不正です: {e}") from e
+
+    def refresh(self, current) -> Optional[Dataset]:
+        """世代番号が current（現在のデータセット）と異なれば新しい世代を開いて返す
+
+        リクエストごとに呼ばれる。世代が変わっていなければ None を返す。
+        """
+        generation = self.generation()
+        if generation == 0 or (current is not None and current.version == generation):
+            return None
+        with self._lock:
+            # 他のスレッドが先に開いていればそれを使う
+            if self._opened is not None and self._opened.version == generation:
+                return self._opened
+            if self._failed_generation == generation:
+                return None
+            try:
+                self._opened = self.open(generation)
+            except SharedDatasetError as e:
+                print(f"共有データセットの世代{generation}に切り替えられません: {e}")
+                self._failed_generation = generation
+                return None
+            return self._opened
@@ -0,0 +1,84 @@
+# 特徴量空間での類似ライバー検索
+import numpy as np
+
+from data.recommender import top_k_indices
+from data.roster_store import RosterStore
+
+
+class SimilarityIndex:
+    """標準化済み特徴量行列のコサイン類似度で似ているライバーを探す索引
+
+    特徴量行列のマルチホット列は平均を引かずにスケーリングされているため、
+    全列からロスターの列平均を引いて（全列を標準化した空間にして）から
+    コサイン類似度を計算する。平均を引かないと、マルチホット列だけは
+    「同じ値を持つか」ではなく「どちらも1か」の一致になってしまう。
+    行ベクトルを事前にL2正規化した密行列（float32）として保持するため、
+    1件の検索は行列ベクトル積1回と部分ソートで済む。同じ類似度の行は
+    索引内の並び順（クラスタ順・元の行順）で選ばれる。
+    """
+
+    def __init__(self, df, matrix, roster=None):
+        self.n_rows = len(df)
+        self.names = df["name"].tolist()
+        self.roster = roster if roster is not None else RosterStore.from_frame(df)
+
+        # 名前 -> 行番号（同名がある場合は先頭の行）
+        self.rows = {}
+        for i, name in enumerate(self.names):
+            self.rows.setdefault(name, i)
+
+        if hasattr(matrix, "toarray"):
+            matrix = matrix.toarray()
+        vectors = np.asarray(matrix, dtype=np.float64).reshape(self.n_rows, -1)
+        if self.n_rows:
+            vectors = vectors - vectors.mean(axis=0)
+        vectors = vectors.astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+
+        # 同じクラスタの行が連続するように並べ替えて保持する
+        # （クラスタ内の検索がコピーなしの部分行列への積で済む）
+        self.cluster_bounds = {}
+        if "cluster" in df.columns:
+            clusters = df["cluster"].to_numpy()
+            self.order = np.argsort(clusters, kind="stable")
+            sorted_clusters = clusters[self.order]
+            changed = sorted_clusters[1:] != sorted_clusters[:-1]
+            starts = np.flatnonzero(np.r_[True, changed])
+            ends = np.r_[starts[1:], self.n_rows]
+            for start, end in zip(starts, ends):
+                self.cluster_bounds[sorted_clusters[start]] = (int(start), int(end))
+            self.clusters = clusters
+        else:
+            self.order = np.arange(self.n_rows)
+            self.clusters = None
+        self.positions = np.empty(self.n_rows, dtype=np.int64)
+        self.positions[self.order] = np.arange(self.n_rows)
+        self.vectors = np.ascontiguousarray((vectors / norms)[self.order])
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    def nearest(self, name, k=10, same_cluster=False):
+        """name に似ているライバー上位k件の (行番号, 類似度) を返す（本人は除く）"""
+        row = self.rows[name]
+        position = self.positions[row]
+        query = self.vectors[position]
+
+        start, end = 0, self.n_rows
+        if same_cluster and self.clusters is not None:
+            start, end = self.cluster_bounds[self.clusters[row]]
+        scores = self.vectors[start:end] @ query
+        # 本人が選ばれないよう最小値にする
+        scores[position - start] = -np.inf
+
+        top = top_k_indices(scores, min(k, end - start - 1))
+        return self.order[start + top], scores[top]
+
+    def similar(self, name, k=10, same_cluster=False):
+        """name に似ているライバー上位k件の情報を類似度付きで返す"""
+        rows, scores = self.nearest(name, k, same_cluster)
+        return [
+            {**record, "similarity": round(float(score), 4)}
+            for record, score in zip(self.roster.records(rows), scores)
+        ]
@@ -0,0 +1,330 @@
+# ロスター（ライバーデータ・特徴量・クラスタリング結果）のスナップショット保存と読み込み
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+
+from data.features import FeaturePipeline, MultiLabelVocabulary
+
+
+# スナップショット形式のバージョン（形式を変えたら上げる）
+SNAPSHOT_VERSION = 2
+
+# 既定の保存先（環境変数 VTUBER_SNAPSHOT_DIR で変更可能）
+DEFAULT_SNAPSHOT_DIR = os.environ.get(
+    "VTUBER_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "snapshots"),
+)
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+OBJECT_COLUMNS_FILE = "object_columns.json"
+
+# 保持する過去のスナップショット数
+KEEP_SNAPSHOTS = 2
+
+
+class SnapshotError(Exception):
+    """スナップショットが存在しない、または読み込めない"""
+
+
+def _save_array(path, array):
+    with open(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def save_snapshot(df, clusters, scaler, kmeans, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    """スナップショットを書き出す
+
+    新しいディレクトリに全ファイルを書き終えてから CURRENT を置き換えるため、
+    書き込み途中でプロセスが落ちても読み込み側が壊れたデータを見ることはない。
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    work_dir = os.path.join(snapshot_dir, f".{name}.tmp")
+    os.makedirs(os.path.join(work_dir, "columns"))
+
+    try:
+        df = df.reset_index(drop=True)
+
+        # ロスター本体: 数値列は列ごとの .npy、それ以外は列指向のJSON
+        columns = []
+        object_columns = {}
+        for i, column in enumerate(df.columns):
+            values = df[column].to_numpy()
+            if values.dtype.kind in "biuf":
+                file_name = f"columns/{i:04d}.npy"
+                _save_array(os.path.join(work_dir, file_name), values)
+                columns.append({"name": column, "kind": "array", "file": file_name})
+            else:
+                object_columns[column] = df[column].tolist()
+                columns.append({"name": column, "kind": "object"})
+        _write_json(os.path.join(work_dir, OBJECT_COLUMNS_FILE), object_columns)
+
+        # 特徴量行列（クラスタリングの入力、CSR形式のまま保存）
+        matrix = sparse.csr_matrix(scaler.matrix_)
+        _save_array(os.path.join(work_dir, "features_data.npy"), matrix.data)
+        _save_array(os.path.join(work_dir, "features_indices.npy"), matrix.indices)
+        _save_array(os.path.join(work_dir, "features_indptr.npy"), matrix.indptr)
+
+        # 特徴量パイプラインと KMeans の学習結果
+        numeric_scaler = scaler.numeric_scaler
+        multi_hot_scaler = scaler.multi_hot_scaler
+        n_multi_hot = len(scaler.vocabulary.feature_columns())
+        _save_array(os.path.join(work_dir, "numeric_mean.npy"), numeric_scaler.mean_)
+        _save_array(os.path.join(work_dir, "numeric_scale.npy"), numeric_scaler.scale_)
+        _save_array(os.path.join(work_dir, "numeric_var.npy"), numeric_scaler.var_)
+        _save_array(
+            os.path.join(work_dir, "multi_hot_scale.npy"),
+            getattr(multi_hot_scaler, "scale_", np.ones(n_multi_hot)),
+        )
+        _save_array(
+            os.path.join(work_dir, "multi_hot_var.npy"),
+            getattr(multi_hot_scaler, "var_", np.ones(n_multi_hot)),
+        )
+        _save_array(os.path.join(work_dir, "cluster_centers.npy"), kmeans.cluster_centers_)
+        _save_array(os.path.join(work_dir, "labels.npy"), np.asarray(clusters))
+        if isinstance(kmeans, MiniBatchKMeans):
+            # partial_fit で中心を更新し続けるための各中心の重み（クラスタの人数）
+            _save_array(
+                os.path.join(work_dir, "cluster_counts.npy"),
+                np.bincount(np.asarray(clusters), minlength=kmeans.n_clusters),
+            )
+
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "n_rows": len(df),
+            "columns": columns,
+            "numeric_columns": scaler.numeric_columns,
+            "vocabulary": scaler.vocabulary.to_dict(),
+            "scaler_n_samples_seen": int(np.max(numeric_scaler.n_samples_seen_)),
+            "n_clusters": int(kmeans.n_clusters),
+            "kmeans_backend": (
+                "minibatch" if isinstance(kmeans, MiniBatchKMeans) else "kmeans"
+            ),
+            "kmeans_params": {
+                key: value
+                for key, value in kmeans.get_params().items()
+                if key in ("max_iter", "batch_size", "tol", "reassignment_ratio")
+            },
+            "kmeans_random_state": kmeans.random_state,
+            "kmeans_inertia": float(kmeans.inertia_),
+            "kmeans_n_iter": int(kmeans.n_iter_),
+        }
+        # manifest は最後に書く（manifest がある = 全ファイルが揃っている）
+        _write_json(os.path.join(work_dir, MANIFEST_FILE), manifest)
+
+        final_dir = os.path.join(snapshot_dir, name)
+        os.rename(work_dir, final_dir)
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+    # CURRENT を原子的に差し替える
+    current_tmp = os.path.join(snapshot_dir, f".{CURRENT_FILE}.{name}.tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, os.path.join(snapshot_dir, CURRENT_FILE))
+
+    _remove_old_snapshots(snapshot_dir, keep=name)
+    return final_dir
+
+
+def _remove_old_snapshots(snapshot_dir, keep):
+    """古いスナップショットを削除（直近 KEEP_SNAPSHOTS 件は残す）"""
+    names = sorted(
+        (
+            entry
+            for entry in os.listdir(snapshot_dir)
+            if not entry.startswith(".")
+            and os.path.isdir(os.path.join(snapshot_dir, entry))
+        ),
+        key=lambda entry: os.path.getmtime(os.path.join(snapshot_dir, entry)),
+    )
+    for name in names[:-KEEP_SNAPSHOTS]:
+        if name != keep:
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+
+
+def _load_array(path):
+    """配列をメモリに読み込む（sklearn の疎行列処理は書き込み可能な配列を要求するため
+    メモリマップはしない）"""
+    try:
+        return np.load(path, allow_pickle=False)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"配列を読み込めません: {path}: {e}") from e
+
+
+def load_snapshot(snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    """スナップショットを読み込む（再学習は行わない）
+
+    戻り値は (df, clusters, pipeline, kmeans, features)。特徴量行列は
+    CSR行列として返す（pipeline.matrix_ と同じもの）。
+    """
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_FILE), encoding="utf-8") as f:
+            name = f.read().strip()
+        path = os.path.join(snapshot_dir, name)
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(os.path.join(path, OBJECT_COLUMNS_FILE), encoding="utf-8") as f:
+            object_columns = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"スナップショットを読み込めません: {e}") from e
+
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        raise SnapshotError(
+            f"スナップショットのバージョンが異なります: {manifest.get('version')}"
+        )
+
+    required = {
+        "n_rows",
+        "columns",
+        "numeric_columns",
+        "vocabulary",
+        "n_clusters",
+        "scaler_n_samples_seen",
+    }
+    if not required <= manifest.keys():
+        raise SnapshotError(f"manifest に必要な項目がありません: {required - manifest.keys()}")
+
+    n_rows = manifest["n_rows"]
+    numeric_columns = manifest["numeric_columns"]
+    vocabulary = MultiLabelVocabulary.from_dict(manifest["vocabulary"])
+
+    # ロスター本体を復元
+    data = {}
+    for column in manifest["columns"]:
+        if column["kind"] == "array":
+            values = _load_array(os.path.join(path, column["file"]))
+        else:
+            if column["name"] not in object_columns:
+                raise SnapshotError(f"列がありません: {column['name']}")
+            values = pd.Series(object_columns[column["name"]], dtype=object)
+        if len(values) != n_rows:
+            raise SnapshotError(f"列の長さが一致しません: {column['name']}")
+        data[column["name"]] = values
+    df = pd.DataFrame(data)
+
+    labels = _load_array(os.path.join(path, "labels.npy"))
+    centers = _load_array(os.path.join(path, "cluster_centers.npy"))
+    mean = _load_array(os.path.join(path, "numeric_mean.npy"))
+    scale = _load_array(os.path.join(path, "numeric_scale.npy"))
+    var = _load_array(os.path.join(path, "numeric_var.npy"))
+    multi_hot_scale = _load_array(os.path.join(path, "multi_hot_scale.npy"))
+    multi_hot_var = _load_array(os.path.join(path, "multi_hot_var.npy"))
+
+    # スキーマの整合性を確認
+    n_numeric = len(numeric_columns)
+    n_multi_hot = len(vocabulary.feature_columns())
+    n_features = n_numeric + n_multi_hot
+    if (
+        labels.shape != (n_rows,)
+        or centers.shape != (manifest["n_clusters"], n_features)
+        or not (mean.shape == scale.shape == var.shape == (n_numeric,))
+        or not (multi_hot_scale.shape == multi_hot_var.shape == (n_multi_hot,))
+        or any(c not in df.columns for c in numeric_columns)
+    ):
+        raise SnapshotError("スナップショットのスキーマが一致しません")
+
+    # 特徴量行列
+    try:
+        features = sparse.csr_matrix(
+            (
+                _load_array(os.path.join(path, "features_data.npy")),
+                _load_array(os.path.join(path, "features_indices.npy")),
+                _load_array(os.path.join(path, "features_indptr.npy")),
+            ),
+            shape=(n_rows, n_features),
+        )
+    except ValueError as e:
+        raise SnapshotError(f"特徴量行列を復元できません: {e}") from e
+
+    pipeline = FeaturePipeline(numeric_columns, vocabulary)
+    pipeline.numeric_scaler = restore_scaler(
+        mean, scale, var, manifest["scaler_n_samples_seen"]
+    )
+    pipeline.multi_hot_scaler = restore_scaler(
+        None, multi_hot_scale, multi_hot_var, manifest["scaler_n_samples_seen"]
+    )
+    pipeline.matrix_ = features
+
+    counts = None
+    if manifest.get("kmeans_backend") == "minibatch":
+        counts = _load_array(os.path.join(path, "cluster_counts.npy"))
+        if counts.shape != (manifest["n_clusters"],):
+            raise SnapshotError("スナップショットのスキーマが一致しません")
+
+    kmeans = restore_kmeans(
+        centers,
+        labels,
+        random_state=manifest.get("kmeans_random_state"),
+        inertia=manifest.get("kmeans_inertia", 0.0),
+        n_iter=manifest.get("kmeans_n_iter", 0),
+        params=manifest.get("kmeans_params"),
+        counts=counts,
+    )
+
+    return df, labels, pipeline, kmeans, features
+
+
+def restore_scaler(mean, scale, var, n_samples_seen):
+    """保存済みのパラメータから学習済み StandardScaler を復元（mean が None なら平均を引かない）"""
+    scaler = StandardScaler(with_mean=mean is not None)
+    scaler.mean_ = None if mean is None else np.asarray(mean, dtype=np.float64)
+    scaler.scale_ = np.asarray(scale, dtype=np.float64)
+    scaler.var_ = np.asarray(var, dtype=np.float64)
+    scaler.n_samples_seen_ = int(n_samples_seen)
+    scaler.n_features_in_ = len(scaler.scale_)
+    return scaler
+
+
+def restore_kmeans(
+    centers, labels, random_state=None, inertia=0.0, n_iter=0, params=None, counts=None
+):
+    """保存済みのクラスタ中心から学習済み KMeans を復元
+
+    sklearn の内部属性には触れず、公開APIだけで復元する。中心を初期値
+    （init=centers, n_init=1）にして中心そのものを学習させると、各中心が
+    自分自身に割り当てられるため中心は変わらない。
+    counts（各中心の重み）を渡すと、partial_fit を続けられる MiniBatchKMeans
+    として復元する（中心を counts で重み付けして partial_fit する）。
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    params = dict(params or {}, n_clusters=len(centers), init=centers, n_init=1)
+
+    if counts is not None:
+        kmeans = MiniBatchKMeans(random_state=random_state, **params)
+        # 重みの小さい中心が別の点に置き換えられないよう、復元時だけ再割り当てを止める
+        reassignment_ratio = kmeans.reassignment_ratio
+        kmeans.set_params(reassignment_ratio=0.0)
+        kmeans.partial_fit(centers, sample_weight=np.asarray(counts, dtype=np.float64))
+        kmeans.set_params(reassignment_ratio=reassignment_ratio)
+    else:
+        kmeans = KMeans(random_state=random_state, **params).fit(centers)
+
+    # 学習結果の公開属性を保存時の値に戻す（重心計算の丸め誤差も残さない）
+    kmeans.cluster_centers_ = centers
+    kmeans.labels_ = np.asarray(labels)
+    kmeans.inertia_ = float(inertia)
+    kmeans.n_iter_ = int(n_iter)
+    return kmeans
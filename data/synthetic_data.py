@@ -0,0 +1,85 @@
+# ベンチマーク用の合成ライバーデータ
+import numpy as np
+
+from data.lazy_imports import lazy_import
+from data.vtuber_data import create_sample_vtuber_data
+
+pd = lazy_import("pandas")
+
+# サンプルデータと同じ範囲で作成する数値項目: 列名 -> (最小値, 最大値)
+SKILL_RANGES = {
+    "streaming_frequency": (1, 7),
+    "collab_frequency": (0, 10),
+    "singing_skill": (1, 10),
+    "gaming_skill": (1, 10),
+    "talk_skill": (1, 10),
+}
+
+# リスト項目ごとの要素数の範囲
+LIST_SIZES = {
+    "personality_traits": (1, 3),
+    "streaming_genres": (1, 3),
+    "game_genres": (1, 3),
+}
+
+CATEGORICAL_COLUMNS = ["gender", "voice_type", "main_streaming_time", "avatar_color_theme"]
+
+DEBUT_RANGE = ("2018-01-01", "2025-01-01")
+
+
+def _sample_lists(rng, vocabulary, n, min_size, max_size):
+    """語彙から重複なしで min_size〜max_size 個を選んだリストを n 行分作成"""
+    vocabulary = np.asarray(vocabulary, dtype=object)
+    size = min(max_size, len(vocabulary))
+    # 行ごとに乱数で並べた語彙の先頭 size 個を使う
+    picks = np.argsort(rng.random((n, len(vocabulary))), axis=1)[:, :size]
+    lengths = rng.integers(min(min_size, size), size + 1, size=n)
+    values = vocabulary[picks]
+    return [row[:length].tolist() for row, length in zip(values, lengths)]
+
+
+def create_synthetic_vtuber_data(n, seed=42):
+    """サンプルデータと同じスキーマ・語彙で n 名分の合成データを作成
+
+    同じ n と seed なら常に同じデータになる。カテゴリ項目はサンプルデータの
+    出現頻度に従って選び、登録者数は対数正規分布、平均視聴者数は登録者数に
+    比例するように作成する。
+    """
+    rng = np.random.default_rng(seed)
+    sample = create_sample_vtuber_data()
+
+    data = {"name": [f"合成ライバー{i:07d}" for i in range(n)]}
+
+    start, end = (np.datetime64(d) for d in DEBUT_RANGE)
+    days = rng.integers(0, (end - start).astype(int), size=n)
+    data["debut_date"] = np.datetime_as_string(start + days, unit="D").tolist()
+
+    # カテゴリ項目はサンプルデータの値をそのままの頻度で使う
+    for column in CATEGORICAL_COLUMNS:
+        values = sample[column].to_numpy(dtype=object)
+        data[column] = values[rng.integers(0, len(values), size=n)].tolist()
+
+    for column, (min_size, max_size) in LIST_SIZES.items():
+        vocabulary = sorted({value for items in sample[column] for value in items})
+        data[column] = _sample_lists(rng, vocabulary, n, min_size, max_size)
+
+    log_subscribers = np.log(sample["subscriber_count"].to_numpy(dtype=np.float64))
+    subscribers = np.exp(
+        rng.normal(log_subscribers.mean(), max(log_subscribers.std(), 0.5), size=n)
+    )
+    data["subscriber_count"] = np.round(subscribers, -3).astype(np.int64)
+    viewer_ratio = (sample["average_viewers"] / sample["subscriber_count"]).to_numpy()
+    data["average_viewers"] = np.round(
+        subscribers * rng.uniform(viewer_ratio.min(), viewer_ratio.max(), size=n), -2
+    ).astype(np.int64)
+
+    for column, (low, high) in SKILL_RANGES.items():
+        data[column] = rng.integers(low, high + 1, size=n)
+
+    return pd.DataFrame(data, columns=list(sample.columns))
+
+
+if __name__ == "__main__":
+    # テスト実行
+    df = create_synthetic_vtuber_data(5)
+    print(df.to_string())
@@ -1,9 +1,33 @@
-import pandas as pd
+import copy
+import os
+import time
+
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-import json
+
+from data.features import MULTI_LABEL_COLUMNS, FeaturePipeline, MultiLabelVocabulary
+from data.lazy_imports import lazy_import
+from data.metrics import stage_timer
+
+# 読み込みに時間がかかるため初回使用時に読み込む
+pd = lazy_import("pandas")
+cluster = lazy_import("sklearn.cluster")
+
+
+# クラスタリングの実装（"kmeans": 全件で学習, "minibatch": MiniBatchKMeans）
+CLUSTERING_BACKENDS = ("kmeans", "minibatch")
+DEFAULT_CLUSTERING_BACKEND = os.environ.get("VTUBER_CLUSTERING_BACKEND", "kmeans")
+
+# クラスタ数（"auto" で自動選択、環境変数 VTUBER_N_CLUSTERS で変更可能）
+DEFAULT_N_CLUSTERS = os.environ.get("VTUBER_N_CLUSTERS", "4")
+# 自動選択で候補にするクラスタ数と、選択にかけてよい時間（秒）
+AUTO_K_RANGE = range(2, 11)
+AUTO_K_TIME_BUDGET = float(os.environ.get("VTUBER_AUTO_K_TIME_BUDGET", "30"))
+# 自動選択が期限内に終わらなかった場合のクラスタ数
+FALLBACK_N_CLUSTERS = 4
+# 期限内に1つも学習できなかった場合の学習用に残しておく時間の割合と、その学習
+# （MiniBatchKMeans）の反復回数の上限
+AUTO_K_FALLBACK_SHARE = 0.2
+FALLBACK_MAX_ITER = 20
 
 
 def create_sample_vtuber_data():
@@ -196,8 +220,12 @@ def create_sample_vtuber_data():
     return pd.DataFrame(vtubers)
 
 
-def encode_categorical_features(df):
-    """カテゴリカル特徴量を数値化"""
+def encode_categorical_features(df, vocabulary=None):
+    """カテゴリカル特徴量を数値化
+
+    vocabulary を渡すとその語彙でワンホット列を作成し、新しく現れた値は語彙の
+    末尾に追加する（渡した語彙はその場で更新される）。
+    """
 
     # 性別をエンコード
     df["gender_encoded"] = df["gender"].map({"女性": 0, "男性": 1})
@@ -210,85 +238,335 @@ def encode_categorical_features(df):
     time_mapping = {"昼": 0, "夕方": 1, "夜": 2}
     df["main_streaming_time_encoded"] = df["main_streaming_time"].map(time_mapping)
 
-    # 配信ジャンルの数値化（ワンホットエンコーディング）
-    all_streaming_genres = set()
-    for genres in df["streaming_genres"]:
-        all_streaming_genres.update(genres)
-
-    for genre in all_streaming_genres:
-        df[f"streaming_{genre}"] = df["streaming_genres"].apply(
-            lambda x: 1 if genre in x else 0
+    # 配信ジャンル・ゲームジャンル・性格特性のマルチホットエンコーディング
+    if vocabulary is None:
+        vocabulary = MultiLabelVocabulary()
+    vocabulary.update(df)
+
+    onehot_columns = vocabulary.feature_columns()
+    onehot = pd.DataFrame(
+        vocabulary.transform(df).toarray(), columns=onehot_columns, index=df.index
+    )
+
+    # 1回の連結でまとめて追加する（同名の列があれば置き換える）
+    df = df.drop(columns=[c for c in onehot_columns if c in df.columns])
+    return pd.concat([df, onehot], axis=1)
+
+
+def encode_vtuber_chunks(chunks):
+    """チャンクごとに届くロスターを順にエンコードし、1つの DataFrame にまとめる
+
+    各チャンクは届いた時点で共通の語彙でエンコードする（取得中の後続のチャンクを
+    待たない）。最後にワンホット列を値の文字列順に揃えて連結するため、全件を
+    まとめて encode_categorical_features した場合と同じ列・値になる。
+    """
+    vocabulary = MultiLabelVocabulary()
+    encoded = []
+    for chunk in chunks:
+        for column, _ in MULTI_LABEL_COLUMNS:
+            if column not in chunk.columns:
+                chunk[column] = np.nan
+        with stage_timer("encode"):
+            encoded.append(encode_categorical_features(chunk, vocabulary))
+    if not encoded:
+        return pd.DataFrame()
+
+    # 全件をまとめてエンコードした場合と同じ語彙の順（新しい値同士は文字列順）
+    vocabulary = MultiLabelVocabulary(
+        {column: sorted(values, key=str) for column, values in vocabulary.values.items()}
+    )
+    onehot_columns = vocabulary.feature_columns()
+    onehot = set(onehot_columns)
+    base_columns = list(
+        dict.fromkeys(c for frame in encoded for c in frame.columns if c not in onehot)
+    )
+    for i, frame in enumerate(encoded):
+        # 後のチャンクで初めて現れた値のワンホット列は0で埋める
+        missing = [c for c in onehot_columns if c not in frame.columns]
+        if missing:
+            frame = pd.concat(
+                [
+                    frame,
+                    pd.DataFrame(
+                        np.zeros((len(frame), len(missing)), dtype=np.uint8),
+                        index=frame.index,
+                        columns=missing,
+                    ),
+                ],
+                axis=1,
+            )
+        encoded[i] = frame.reindex(columns=base_columns + onehot_columns)
+    return pd.concat(encoded, ignore_index=True)
+
+
+def clustering_backend(model):
+    """学習済みモデルのクラスタリング実装名を返す"""
+    return "minibatch" if isinstance(model, cluster.MiniBatchKMeans) else "kmeans"
+
+
+def create_clusterer(
+    n_clusters=4,
+    backend=None,
+    batch_size=1024,
+    max_iter=None,
+    init_centers=None,
+):
+    """クラスタリングのモデルを作成
+
+    init_centers を渡すとその中心から学習を始める（ウォームスタート）。
+    max_iter を省略した場合は各実装の既定値を使う。
+    """
+    backend = backend or DEFAULT_CLUSTERING_BACKEND
+    if backend not in CLUSTERING_BACKENDS:
+        raise ValueError(f"不明なクラスタリング実装です: {backend}")
+
+    params = {"n_clusters": n_clusters, "random_state": 42}
+    if max_iter is not None:
+        params["max_iter"] = max_iter
+    if init_centers is not None:
+        params["init"] = init_centers
+        params["n_init"] = 1
+
+    if backend == "minibatch":
+        return cluster.MiniBatchKMeans(batch_size=batch_size, **params)
+    return cluster.KMeans(**params)
+
+
+def warm_start_centers(X, previous_clusters, n_clusters):
+    """前回のクラスタ割り当てから初期中心を作成
+
+    スケーラーや語彙が変わっても使えるよう、前回の中心そのものではなく
+    前回同じクラスタだった行の平均を新しい特徴量行列で計算する。
+    割り当てのない行（新規ライバー）は NaN で渡す。空のクラスタがある場合は None。
+    """
+    labels = pd.to_numeric(pd.Series(previous_clusters), errors="coerce").to_numpy()
+    centers = np.zeros((n_clusters, X.shape[1]), dtype=np.float64)
+    for cluster_id in range(n_clusters):
+        rows = np.flatnonzero(labels == cluster_id)
+        if len(rows) == 0:
+            return None
+        centers[cluster_id] = np.asarray(X[rows].mean(axis=0)).ravel()
+    return centers
+
+
+def parse_n_clusters(value):
+    """クラスタ数の指定を解釈（"auto" またはクラスタ数）"""
+    if value is None:
+        value = DEFAULT_N_CLUSTERS
+    if isinstance(value, str):
+        if value.strip().lower() == "auto":
+            return "auto"
+        value = value.strip()
+    n_clusters = int(value)
+    if n_clusters < 1:
+        raise ValueError(f"クラスタ数は1以上を指定してください: {value}")
+    return n_clusters
+
+
+def perform_clustering(
+    df,
+    n_clusters=None,
+    backend=None,
+    batch_size=1024,
+    max_iter=None,
+    previous_clusters=None,
+    k_range=AUTO_K_RANGE,
+    time_budget=AUTO_K_TIME_BUDGET,
+    n_jobs=None,
+):
+    """クラスタリングを実行
+
+    特徴量行列は FeaturePipeline で一度だけ作成し、推薦・類似度計算・可視化でも
+    再利用できるよう pipeline.matrix_ に保持する。戻り値の3番目は StandardScaler
+    の代わりにこのパイプラインを返す。
+    backend="minibatch" では MiniBatchKMeans で学習し、previous_clusters（行ごとの
+    前回のクラスタ）があればそこからウォームスタートする。
+    n_clusters="auto" では k_range の各クラスタ数を n_jobs プロセスで並列に学習し、
+    シルエット係数が最も高いモデルを選ぶ。選択には time_budget の
+    1 - AUTO_K_FALLBACK_SHARE だけを使い、残りは期限内に1つも学習できなかった
+    場合の k=FALLBACK_N_CLUSTERS の学習に残す。選択のレポートは
+    kmeans.selection_report_ に保持する。
+    """
+
+    # 明示的な特徴量スキーマ（数値列 + マルチホット列）で特徴量行列を作成
+    pipeline = FeaturePipeline.from_roster(df)
+    X_scaled = pipeline.fit_transform(df)
+
+    print(
+        f"Using {len(pipeline.feature_columns)} features for clustering: "
+        f"{pipeline.feature_columns}"
+    )
+
+    n_clusters = parse_n_clusters(n_clusters)
+    backend = backend or DEFAULT_CLUSTERING_BACKEND
+
+    if n_clusters == "auto":
+        from data.cluster_selection import select_n_clusters
+
+        # 時間の一部は、期限内に1つも学習できなかった場合の学習用に残しておく
+        selection_budget = (
+            time_budget * (1 - AUTO_K_FALLBACK_SHARE) if time_budget is not None else None
         )
-
-    # ゲームジャンルの数値化
-    all_game_genres = set()
-    for genres in df["game_genres"]:
-        all_game_genres.update(genres)
-
-    for genre in all_game_genres:
-        df[f"game_{genre}"] = df["game_genres"].apply(lambda x: 1 if genre in x else 0)
-
-    # 性格特性の数値化
-    all_personality_traits = set()
-    for traits in df["personality_traits"]:
-        all_personality_traits.update(traits)
-
-    for trait in all_personality_traits:
-        df[f"personality_{trait}"] = df["personality_traits"].apply(
-            lambda x: 1 if trait in x else 0
+        kmeans, report = select_n_clusters(
+            X_scaled,
+            k_values=k_range,
+            backend=backend,
+            batch_size=batch_size,
+            max_iter=max_iter,
+            n_jobs=n_jobs,
+            time_budget=selection_budget,
+            fallback_k=FALLBACK_N_CLUSTERS,
         )
-
-    return df
-
-
-def perform_clustering(df, n_clusters=4):
-    """クラスタリングを実行"""
-
-    # 数値特徴量を選択
-    numerical_features = [
-        "subscriber_count",
-        "average_viewers",
-        "streaming_frequency",
-        "collab_frequency",
-        "singing_skill",
-        "gaming_skill",
-        "talk_skill",
-        "gender_encoded",
-        "voice_type_encoded",
-        "main_streaming_time_encoded",
-    ]
-
-    # ワンホットエンコードされた特徴量を追加
-    encoded_features = [
-        col
-        for col in df.columns
-        if col.startswith(("streaming_", "game_", "personality_"))
-    ]
-    all_features = numerical_features + encoded_features
-
-    # 特徴量が存在するかチェック
-    available_features = [f for f in all_features if f in df.columns]
-
-    # データフレームをコピーして作業用に使用
-    df_work = df.copy()
-    X = df_work[available_features].fillna(0)
-
-    # すべて数値型であることを確認
-    X = X.select_dtypes(include=[np.number])
-
-    print(f"Using {len(X.columns)} features for clustering: {list(X.columns)}")
-
-    # 標準化
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-
-    # クラスタリング
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+        report["time_budget"] = time_budget
+        report["selection_time_budget"] = selection_budget
+        for candidate in report["candidates"]:
+            print(f"k={candidate['k']}: {candidate}")
+        if kmeans is None:
+            print(
+                f"期限内にどのクラスタ数も学習できなかったため、残りの時間で"
+                f" k={FALLBACK_N_CLUSTERS} を MiniBatchKMeans で学習します"
+            )
+            started = time.perf_counter()
+            kmeans = create_clusterer(
+                min(FALLBACK_N_CLUSTERS, X_scaled.shape[0]),
+                backend="minibatch",
+                batch_size=batch_size,
+                max_iter=FALLBACK_MAX_ITER,
+            )
+            kmeans.fit(X_scaled)
+            report["chosen_k"] = kmeans.n_clusters
+            report["chosen_by"] = "fallback"
+            report["fallback_seconds"] = round(time.perf_counter() - started, 4)
+        elif report["chosen_by"] == "unscored":
+            print(
+                f"期限内に評価が終わらなかったため、学習済みのクラスタ数"
+                f" {kmeans.n_clusters} を使います"
+            )
+        else:
+            print(f"クラスタ数 {kmeans.n_clusters} を選択しました")
+        kmeans.selection_report_ = report
+        clusters = kmeans.labels_
+        df["cluster"] = clusters
+        return df, clusters, pipeline, kmeans
+
+    init_centers = None
+    if backend == "minibatch" and previous_clusters is not None:
+        init_centers = warm_start_centers(X_scaled, previous_clusters, n_clusters)
+
+    # クラスタリング（疎行列のまま学習する）
+    kmeans = create_clusterer(
+        n_clusters,
+        backend=backend,
+        batch_size=batch_size,
+        max_iter=max_iter,
+        init_centers=init_centers,
+    )
     clusters = kmeans.fit_predict(X_scaled)
 
     df["cluster"] = clusters
 
-    return df, clusters, scaler, kmeans
+    return df, clusters, pipeline, kmeans
+
+
+def apply_roster_updates(
+    df,
+    updates,
+    removed_names=(),
+    scaler=None,
+    kmeans=None,
+    drift_threshold=0.2,
+    vocabulary=None,
+):
+    """差分（追加・変更・削除されたライバー）だけを反映してロスターを更新
+
+    既存ライバーの行はエンコードし直さずに残し、ワンホット列は新しく現れた値の
+    分だけ追加する。追加・変更されたライバーには現在のモデルでクラスタを割り当て、
+    変更の割合が drift_threshold を超えた場合やモデルがない場合だけ全体を再学習する。
+    MiniBatchKMeans のモデルは追加・変更されたライバーで partial_fit してから
+    全員のクラスタを割り当て直し、再学習時は前回のクラスタからウォームスタートする。
+    scaler には perform_clustering が返した特徴量パイプラインを渡す。vocabulary には
+    現在のロスターの語彙を渡す（省略時はロスターから復元する）。
+
+    戻り値は (df, clusters, scaler, kmeans, refitted)。
+    """
+    removed = set(removed_names)
+    n_before = len(df)
+    n_changed = len(updates) + int(df["name"].isin(removed).sum())
+
+    if n_changed == 0:
+        return df, df["cluster"].to_numpy(), scaler, kmeans, False
+
+    # 削除されたライバーを除外
+    kept = df[~df["name"].isin(removed)].reset_index(drop=True)
+
+    # 追加・変更されたライバーだけをエンコード
+    vocabulary = (
+        vocabulary.copy() if vocabulary is not None else MultiLabelVocabulary.from_roster(df)
+    )
+    update_df = pd.DataFrame(updates)
+    if len(update_df) > 0:
+        update_df = encode_categorical_features(update_df, vocabulary)
+        update_df = update_df.drop_duplicates("name", keep="last").reset_index(drop=True)
+    update_positions = {
+        name: len(kept) + i for i, name in enumerate(update_df.get("name", []))
+    }
+
+    # 変更されたライバーは元の位置で置き換え、新しいライバーは末尾に追加
+    combined = pd.concat([kept, update_df], ignore_index=True)
+    kept_names = set(kept["name"])
+    order = [update_positions.get(name, i) for i, name in enumerate(kept["name"])]
+    order += [pos for name, pos in update_positions.items() if name not in kept_names]
+    combined = combined.iloc[order].reset_index(drop=True)
+
+    # 語彙を拡張したワンホット列は、該当しない行を0で埋める
+    onehot_columns = vocabulary.feature_columns()
+    combined[onehot_columns] = combined[onehot_columns].fillna(0).astype(np.uint8)
+
+    updated_mask = combined["name"].isin(update_positions.keys()).to_numpy()
+    drift = n_changed / max(n_before, 1)
+    refit = (
+        not isinstance(scaler, FeaturePipeline)
+        or kmeans is None
+        or "cluster" not in df.columns
+        or drift > drift_threshold
+    )
+
+    if refit:
+        print(f"変更の割合 {drift:.1%} のためクラスタリングを再学習します")
+        options = {}
+        if kmeans is not None:
+            options = {
+                "n_clusters": kmeans.n_clusters,
+                "backend": clustering_backend(kmeans),
+            }
+            if isinstance(kmeans, cluster.MiniBatchKMeans):
+                options.update(batch_size=kmeans.batch_size, max_iter=kmeans.max_iter)
+        previous_clusters = None
+        if "cluster" in combined.columns:
+            previous_clusters = combined["cluster"].where(~updated_mask).to_numpy()
+        combined = combined.drop(columns=["cluster"], errors="ignore")
+        combined, clusters, scaler, kmeans = perform_clustering(
+            combined, previous_clusters=previous_clusters, **options
+        )
+        return combined, clusters, scaler, kmeans, True
+
+    # 既存モデルで追加・変更されたライバーのクラスタだけを割り当てる
+    # （特徴量行列は学習済みのスケーラーで作り直す。新しい語彙は次の再学習まで使わない）
+    pipeline = scaler.with_matrix(combined)
+    cluster_dtype = df["cluster"].dtype
+    if isinstance(kmeans, cluster.MiniBatchKMeans):
+        # 中心を追加・変更分で更新し、全員を割り当て直す（元のモデルは変更しない）
+        kmeans = copy.deepcopy(kmeans)
+        if updated_mask.any():
+            kmeans.partial_fit(pipeline.matrix_[updated_mask])
+        combined["cluster"] = kmeans.predict(pipeline.matrix_)
+    elif updated_mask.any():
+        combined.loc[updated_mask, "cluster"] = kmeans.predict(
+            pipeline.matrix_[updated_mask]
+        )
+    combined["cluster"] = combined["cluster"].astype(cluster_dtype)
+
+    return combined, combined["cluster"].to_numpy(), pipeline, kmeans, False
 
 
 def load_vtuber_data():
@@ -306,6 +584,44 @@ def load_vtuber_data():
     return df, clusters, scaler
 
 
+# 転置インデックスの対象列
+INDEXED_LIST_COLUMNS = ["streaming_genres", "game_genres", "personality_traits"]
+INDEXED_CATEGORICAL_COLUMNS = ["gender", "voice_type", "main_streaming_time"]
+
+
+def build_roster_index(df):
+    """ジャンル・性格特性・カテゴリ値ごとに該当ライバーの行番号を引ける転置インデックスを作成"""
+
+    index = {}
+
+    # 複数値の列: 値 -> 昇順の行番号配列
+    for column in INDEXED_LIST_COLUMNS:
+        postings = {}
+        if column in df.columns:
+            for row_id, values in enumerate(df[column]):
+                if not isinstance(values, (list, tuple)):
+                    continue
+                for value in dict.fromkeys(values):
+                    postings.setdefault(value, []).append(row_id)
+        index[column] = {
+            value: np.array(row_ids, dtype=np.int64)
+            for value, row_ids in postings.items()
+        }
+
+    # 単一値の列: 値 -> 昇順の行番号配列
+    for column in INDEXED_CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            groups = df.reset_index(drop=True).groupby(column, sort=True).indices
+            index[column] = {
+                value: np.sort(row_ids).astype(np.int64)
+                for value, row_ids in groups.items()
+            }
+        else:
+            index[column] = {}
+
+    return index
+
+
 def get_cluster_characteristics(df):
     """各クラスタの特徴を分析"""
 
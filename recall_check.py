@@ -0,0 +1,102 @@
+# クラスタで絞り込む推薦（IVF）の再現率と速度を、全件を採点する推薦と比較するコマンド
+#
+#   python recall_check.py --size 50k --clusters 16 --nprobe 1 2 4 8
+#   python recall_check.py --nprobe 4 --min-recall 0.95   # 下回ったら終了コード1
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def recall_at_k(engine, preferences, exact_rows, rows, k):
+    """絞り込んだ結果のうち、全件採点の上位k件に入るスコアを持つ行の割合
+
+    k番目と同点の行はどれを選んでも正解とみなす。
+    """
+    if len(exact_rows) == 0:
+        return 1.0
+    scores = engine.score(preferences)
+    kth = scores[exact_rows[-1]]
+    return float(np.count_nonzero(scores[rows] >= kth)) / len(exact_rows)
+
+
+def build_engine(n, n_clusters, seed):
+    """n 名の合成データをクラスタリングして推薦エンジンを作成"""
+    from data.recommender import RecommendationEngine
+    from data.synthetic_data import create_synthetic_vtuber_data
+    from data.vtuber_data import encode_categorical_features, perform_clustering
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        encoded = encode_categorical_features(create_synthetic_vtuber_data(n, seed=seed))
+        df, _, _, _ = perform_clustering(encoded, n_clusters=n_clusters)
+    return df, RecommendationEngine(df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="クラスタで絞り込む推薦の再現率と速度")
+    parser.add_argument("--size", default="50k", help="ライバー数（例: 10k 1M）")
+    parser.add_argument("--clusters", type=int, default=16, help="クラスタ数")
+    parser.add_argument(
+        "--nprobe", type=int, nargs="+", default=[1, 2, 4, 8], help="採点するクラスタ数"
+    )
+    parser.add_argument("--queries", type=int, default=500, help="嗜好の数")
+    parser.add_argument("--k", type=int, default=10, help="推薦件数")
+    parser.add_argument("--seed", type=int, default=42, help="乱数シード")
+    parser.add_argument(
+        "--min-recall", type=float, help="いずれかの nprobe の再現率がこれを下回ったら終了コード1"
+    )
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, PROJECT_ROOT)
+    from benchmark import parse_size, random_preferences, summarize
+
+    n = parse_size(args.size)
+    started = time.perf_counter()
+    df, engine = build_engine(n, args.clusters, args.seed)
+    print(f"{n}名・{args.clusters}クラスタのデータを作成: {time.perf_counter() - started:.1f}秒")
+
+    rng = random.Random(args.seed)
+    queries = [random_preferences(rng, df) for _ in range(args.queries)]
+
+    def timed(func):
+        results, latencies = [], []
+        for preferences in queries:
+            started = time.perf_counter()
+            results.append(func(preferences))
+            latencies.append(time.perf_counter() - started)
+        return results, summarize(latencies)["latency_ms"]["p50"]
+
+    exact, exact_p50 = timed(lambda p: engine.top_k(p, args.k))
+    print(f"  全件採点          p50={exact_p50:8.3f}ms")
+
+    failed = []
+    for nprobe in args.nprobe:
+        pruned, p50 = timed(lambda p: engine.top_k_pruned(p, args.k, nprobe))
+        recall = np.mean(
+            [
+                recall_at_k(engine, p, e, r, args.k)
+                for p, e, r in zip(queries, exact, pruned)
+            ]
+        )
+        print(
+            f"  nprobe={nprobe:<4d}       p50={p50:8.3f}ms"
+            f" ({exact_p50 / p50:4.1f}x)  recall@{args.k}={recall:.3f}"
+        )
+        if args.min_recall is not None and recall < args.min_recall:
+            failed.append(nprobe)
+
+    if failed:
+        print(f"再現率が{args.min_recall}を下回りました: nprobe={failed}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# アプリの起動時間（モジュールの読み込み時間）を計測するコマンド
+#
+#   python startup_profile.py                  # 読み込みに時間がかかるモジュールを表示
+#   python startup_profile.py --budget 1.0     # 予算（秒）を超えたら終了コード1で終了
+#   python startup_profile.py --strict         # 重いモジュールが読み込まれたら終了コード1
+#
+# 予算は環境変数 VTUBER_IMPORT_BUDGET でも指定できる（CIでの回帰チェック用）。
+import argparse
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 起動時に読み込まれてはいけない重いモジュール
+HEAVY_MODULES = ["pandas", "sklearn", "scipy", "plotly", "matplotlib", "seaborn"]
+
+
+def profile_import(module="app"):
+    """新しいPythonプロセスで module を読み込み、-X importtime の結果を返す
+
+    戻り値は (module の読み込み時間[秒], [(モジュール名, 自身の時間, 累計時間), ...])。
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{module} を読み込めません:\n{result.stderr}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        entries.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+
+    total = next((c for name, _, c in entries if name == module), 0.0)
+    return total, entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="アプリの起動時間を計測")
+    parser.add_argument("--module", default="app", help="計測するモジュール")
+    parser.add_argument("--repeat", type=int, default=3, help="計測回数（中央値を使う）")
+    parser.add_argument("--top", type=int, default=15, help="表示するモジュール数")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=float(os.environ["VTUBER_IMPORT_BUDGET"])
+        if os.environ.get("VTUBER_IMPORT_BUDGET")
+        else None,
+        help="読み込み時間の予算（秒）。超えた場合は終了コード1",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="起動時に重いモジュールが読み込まれた場合も終了コード1",
+    )
+    args = parser.parse_args(argv)
+
+    # 中央値の回の内訳を表示する
+    runs = sorted(
+        (profile_import(args.module) for _ in range(max(args.repeat, 1))),
+        key=lambda run: run[0],
+    )
+    median, entries = runs[(len(runs) - 1) // 2]
+
+    print(f"{args.module} の読み込み時間: {median:.3f}秒（{len(runs)}回の中央値）")
+    print(f"\n累計時間の長いモジュール（上位{args.top}件）:")
+    print(f"{'累計[秒]':>10} {'自身[秒]':>10}  モジュール")
+    for name, self_time, cumulative in sorted(entries, key=lambda e: -e[2])[: args.top]:
+        print(f"{cumulative:10.3f} {self_time:10.3f}  {name}")
+
+    loaded = sorted(
+        {name for name, _, _ in entries if name.split(".")[0] in HEAVY_MODULES}
+    )
+    if loaded:
+        roots = sorted({name.split(".")[0] for name in loaded})
+        print(f"\n起動時に重いモジュールが読み込まれています: {', '.join(roots)}")
+        if args.strict:
+            return 1
+
+    if args.budget is not None:
+        if median > args.budget:
+            print(f"\n予算超過: {median:.3f}秒 > {args.budget:.3f}秒")
+            return 1
+        print(f"\n予算内: {median:.3f}秒 <= {args.budget:.3f}秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+# /api/map のパラメータ検証のテスト
+import contextlib
+import io
+import unittest
+
+import app as app_module
+from data.dataset import Dataset
+from data.vtuber_data import load_vtuber_data
+
+
+class MapValidationTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with contextlib.redirect_stdout(io.StringIO()):
+            app_module.set_dataset(Dataset.build(*load_vtuber_data()))
+        cls.client = app_module.app.test_client()
+        cls.total = cls.client.get("/api/map").get_json()["total"]
+
+    def assert_rejected(self, query):
+        response = self.client.get(f"/api/map?{query}")
+        self.assertEqual(response.status_code, 400, query)
+        self.assertFalse(response.get_json()["success"], query)
+
+    def test_valid_request(self):
+        response = self.client.get("/api/map?dims=3&max_points=5&include=0,2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["include"]["count"], 2)
+
+    def test_rejects_invalid_dims(self):
+        self.assert_rejected("dims=4")
+
+    def test_rejects_invalid_viewport(self):
+        for query in (
+            "x_min=0",
+            "x_min=a&x_max=1&y_min=0&y_max=1",
+            "x_min=1&x_max=0&y_min=0&y_max=1",
+            "x_min=nan&x_max=nan&y_min=nan&y_max=nan",
+            "x_min=-inf&x_max=inf&y_min=0&y_max=1",
+        ):
+            self.assert_rejected(query)
+
+    def test_rejects_invalid_include(self):
+        for query in (
+            f"include={self.total}",
+            "include=-1",
+            "include=1.5",
+            "include=²",
+            "include=" + ",".join(["0"] * (app_module.MAX_MAP_INCLUDE + 1)),
+        ):
+            self.assert_rejected(query)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+# 共有データセット（世代の公開と削除）のテスト
+import contextlib
+import gc
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from data import shared_dataset
+from data.dataset import Dataset
+from data.shared_dataset import SharedDatasetStore
+from data.vtuber_data import load_vtuber_data
+
+
+class SharedDatasetStoreTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.dataset = Dataset.build(*load_vtuber_data())
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="vtuber-shared-test-")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def generations(self):
+        return sorted(entry for entry in os.listdir(self.directory) if entry.startswith("gen-"))
+
+    @mock.patch.object(shared_dataset, "KEEP_GENERATIONS", 2)
+    def test_publish_releases_generation_opened_by_refresh(self):
+        # 別のプロセスが公開した世代1を、起動時と同じく refresh で開く
+        with contextlib.redirect_stdout(io.StringIO()):
+            SharedDatasetStore(self.directory).publish(self.dataset)
+        gc.collect()
+        store = SharedDatasetStore(self.directory)
+        opened = store.refresh(None)
+        self.assertEqual(opened.version, 1)
+        del opened
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            store.publish(self.dataset)
+            current = store.publish(self.dataset)
+        gc.collect()
+
+        self.assertEqual(current.version, 3)
+        # 世代1は refresh で開いたままにならず、範囲外になった公開で削除される
+        self.assertEqual(
+            self.generations(),
+            [shared_dataset._generation_name(2), shared_dataset._generation_name(3)],
+        )
+        self.assertIsNone(store.refresh(current))
+
+
+if __name__ == "__main__":
+    unittest.main()